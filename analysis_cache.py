@@ -0,0 +1,106 @@
+# persistent analysis store. results are kept in a fixed size file of 16 byte slots that is memory
+# mapped and indexed by the polyglot key, so they survive between runs and a position that was
+# already searched deep enough never has to be searched again. each engine finds a different best
+# move, so the engine's name goes into the key and one file can hold results for several of them.
+
+
+import hashlib, mmap, os, struct
+from functools import cache
+from move import Move
+from game import Game
+from polyglot import polyglot_key, encode_move, decode_move
+
+
+MAGIC = b'ANCACHE1'
+HEADER_STRUCT = struct.Struct('<8sQ')       # magic, number of slots
+SLOT_STRUCT = struct.Struct('<QHBBf')       # key, move, depth, bound, score
+
+# what the stored score means. an empty slot has no bound.
+BOUND_NONE = 0
+BOUND_EXACT = 1
+BOUND_LOWER = 2     # the real score is at least this
+BOUND_UPPER = 3     # the real score is at most this
+
+
+# mixed into the polyglot key so engines never see each other's results. no name keeps the plain key.
+@cache
+def engine_salt(engine: str) -> int:
+    if not engine: return 0
+    return int.from_bytes(hashlib.blake2b(engine.encode(), digest_size=8).digest(), 'little')
+
+
+class AnalysisCache:
+    def __init__(self, path: str, num_slots: int = 1 << 20):
+        # new files get all their (empty) slots up front, existing files keep their own size
+        if not os.path.exists(path) or os.path.getsize(path) == 0:
+            with open(path, 'wb') as file:
+                file.write(HEADER_STRUCT.pack(MAGIC, num_slots))
+                file.truncate(HEADER_STRUCT.size + num_slots * SLOT_STRUCT.size)
+
+        self.file = open(path, 'r+b')
+        self.data = mmap.mmap(self.file.fileno(), 0)
+
+        magic, self.num_slots = HEADER_STRUCT.unpack_from(self.data, 0)
+        if magic != MAGIC:
+            self.close()
+            raise ValueError(f"Not an analysis cache file: {path}")
+
+
+    def __enter__(self):
+        return self
+
+
+    def __exit__(self, *args):
+        self.close()
+
+
+    def close(self):
+        if self.data is not None:
+            self.data.flush()
+            self.data.close()
+            self.data = None
+        self.file.close()
+
+
+    def _offset(self, key: int) -> int:
+        return HEADER_STRUCT.size + (key % self.num_slots) * SLOT_STRUCT.size
+
+
+    # the stored (move, score, depth, bound) for the position, or None if we have nothing for it
+    def probe(self, game: Game, engine: str = "") -> tuple[Move | None, float, int, int] | None:
+        key = polyglot_key(game) ^ engine_salt(engine)
+        stored_key, raw_move, depth, bound, score = SLOT_STRUCT.unpack_from(self.data, self._offset(key))
+        if bound == BOUND_NONE or stored_key != key: return None
+
+        move = None
+        if raw_move:
+            book_move = decode_move(game, raw_move)
+            move = next((m for m in game.get_all_legal_moves() if m.start_pos == book_move.start_pos and m.end_pos == book_move.end_pos and m.promotion == book_move.promotion), None)
+
+        return (move, score, depth, bound)
+
+
+    # the best move and exact score if the position was already searched to at least this depth
+    def lookup(self, game: Game, depth: int, engine: str = "") -> tuple[Move, float] | None:
+        entry = self.probe(game, engine)
+        if entry is None: return None
+
+        move, score, stored_depth, bound = entry
+        if move is None or bound != BOUND_EXACT or stored_depth < depth: return None
+
+        return (move, score)
+
+
+    # writes a result back. a slot only gets replaced by a different position or a deeper search.
+    def store(self, game: Game, move: Move | None, score: float, depth: int, bound: int = BOUND_EXACT, engine: str = ""):
+        key = polyglot_key(game) ^ engine_salt(engine)
+        offset = self._offset(key)
+
+        stored_key, _, stored_depth, stored_bound, _ = SLOT_STRUCT.unpack_from(self.data, offset)
+        if stored_bound != BOUND_NONE and stored_key == key and stored_depth > depth: return
+
+        SLOT_STRUCT.pack_into(self.data, offset, key, encode_move(move) if move else 0, min(depth, 255), bound, score)
+
+
+    def flush(self):
+        self.data.flush()
@@ -0,0 +1,170 @@
+# engine benchmark. runs every engine over a fixed, versioned set of positions and writes a json
+# report with nodes, time to depth, nodes/sec, peak memory and how often the engines agree on the
+# best move. given a baseline report it fails when throughput drops by more than a threshold.
+# every search is repeated (at least repeats times, and until it has run for min_time seconds) and
+# its median time is what counts, a single short run is far too noisy to gate on.
+#
+#   python bench.py --depth 3 --output bench_report.json
+#   python bench.py --baseline bench_baseline.json --threshold 10 --repeats 5
+
+
+import argparse, json, multiprocessing, platform, random, resource, statistics, sys, time
+from game import Game
+from search_stats import SearchStats
+import engine, optimized_engine
+
+
+# bump the version whenever the positions change, reports of different versions aren't comparable
+BENCH_VERSION = 2
+BENCH_POSITIONS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "r1bqk2r/pppp1ppp/2n2n2/2b1p3/2B1P3/3P1N2/PPP2PPP/RNBQK2R w KQkq - 1 5",
+    "rnbqkb1r/pp3ppp/4pn2/2pp4/3P4/2PBPN2/PP3PPP/RNBQK2R b KQkq - 1 5",
+    "r2q1rk1/pp2bppp/2n1pn2/3p4/3P4/2NBPN2/PP3PPP/R2Q1RK1 w - - 4 10",
+    "1r3k1r/pNqnppb1/6pn/2p3Np/7P/2P2Q2/PP3PP1/R1B1K2R w KQ - 2 15",
+    "5rk1/R4pp1/1p5p/3Q4/1PPp2q1/3P2P1/5P2/4K3 b - - 0 34",
+    "r4rk1/1pp1qppp/p1np1n2/2b1p1B1/2B1P1b1/P1NP1N2/1PP1QPPP/R4RK1 w - - 0 10",
+    "6k1/5ppp/8/8/8/8/5PPP/3R2K1 w - - 0 1",
+    "8/8/4k3/8/2p5/8/B2K4/8 w - - 0 1",
+    "8/2p5/3p4/KP5r/1R3p1k/8/4P1P1/8 w - - 0 1",
+    "4k3/8/8/8/8/8/4P3/4K3 w - - 0 1"
+]
+
+# every engine as (game, depth, stats) -> best move
+ENGINES = {
+    "brute_force": lambda game, depth, stats: engine.brute_force_best_move(game, depth, stats)[0],
+    "optimized": lambda game, depth, stats: optimized_engine.optimized_engine(game, depth, stats=stats)
+}
+
+
+# one search from scratch, returns (move, nodes, seconds)
+def timed_search(name: str, fen: str, depth: int, seed: int):
+    random.seed(seed)
+    optimized_engine.transposition_table.clear()
+    stats = SearchStats()
+    game = Game(fen)
+
+    start = time.perf_counter()
+    move = ENGINES[name](game, depth, stats)
+    return (move, stats.nodes, time.perf_counter() - start)
+
+
+# runs one engine over every position at every depth up to max_depth. this runs in its own
+# process so the peak memory (and the transposition table) belong to this engine only.
+def run_engine(name: str, max_depth: int, seed: int, repeats: int = 5, min_time: float = 0.2) -> dict:
+    positions = []
+    total_nodes, total_time = 0, 0.0
+
+    for fen in BENCH_POSITIONS:
+        depths = []
+        time_to_depth = 0.0
+
+        for depth in range(1, max_depth + 1):
+            move, nodes, elapsed = timed_search(name, fen, depth, seed)
+            times = [elapsed]
+            while len(times) < repeats or sum(times) < min_time:
+                times.append(timed_search(name, fen, depth, seed)[2])
+            elapsed = statistics.median(times)
+
+            time_to_depth += elapsed
+            total_nodes += nodes
+            total_time += elapsed
+
+            depths.append({
+                "depth": depth,
+                "nodes": nodes,
+                "time": elapsed,
+                "runs": len(times),
+                "time_to_depth": time_to_depth,
+                "nodes_per_second": nodes / elapsed if elapsed > 0 else 0.0,
+                "best_move": str(move) if move else None
+            })
+
+        positions.append({"fen": fen, "depths": depths})
+
+    return {
+        "positions": positions,
+        "total_nodes": total_nodes,
+        "total_time": total_time,
+        "nodes_per_second": total_nodes / total_time if total_time > 0 else 0.0,
+        "peak_rss_kb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    }
+
+
+def run_benchmark(engines: list[str], max_depth: int = 3, seed: int = 0, repeats: int = 5, min_time: float = 0.2) -> dict:
+    context = multiprocessing.get_context('spawn')
+    results = {}
+    for name in engines:
+        with context.Pool(1) as pool:
+            results[name] = pool.apply(run_engine, (name, max_depth, seed, repeats, min_time))
+
+    # best move agreement at the deepest depth, against the first engine
+    agreement = {}
+    reference = engines[0]
+    for name in engines[1:]:
+        same = sum(1 for ours, theirs in zip(results[name]["positions"], results[reference]["positions"])
+                   if ours["depths"][-1]["best_move"] == theirs["depths"][-1]["best_move"])
+        agreement[name] = same / len(BENCH_POSITIONS)
+
+    return {
+        "version": BENCH_VERSION,
+        "seed": seed,
+        "depth": max_depth,
+        "repeats": repeats,
+        "min_time": min_time,
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "reference_engine": reference,
+        "engines": results,
+        "best_move_agreement": agreement
+    }
+
+
+# compares throughput against a baseline report, returns a list of regressions (empty if fine)
+def compare_to_baseline(report: dict, baseline: dict, threshold_percent: float) -> list[str]:
+    if report["version"] != baseline["version"] or report["depth"] != baseline["depth"]:
+        raise ValueError("Baseline was made with a different position set or depth")
+
+    regressions = []
+    for name, result in report["engines"].items():
+        if name not in baseline["engines"]: continue
+
+        before = baseline["engines"][name]["nodes_per_second"]
+        after = result["nodes_per_second"]
+        change = (after - before) / before * 100 if before else 0.0
+        print(f"{name}: {int(before)} -> {int(after)} nodes/s ({change:+.1f}%)")
+
+        if change < -threshold_percent:
+            regressions.append(f"{name} nodes/s dropped {-change:.1f}% (allowed {threshold_percent}%)")
+
+    return regressions
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="benchmark the engines")
+    parser.add_argument("--depth", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--repeats", type=int, default=5, help="runs per search, the median time counts")
+    parser.add_argument("--min-time", type=float, default=0.2, help="keep repeating a search until it has run this many seconds")
+    parser.add_argument("--engines", nargs="+", default=list(ENGINES), choices=list(ENGINES))
+    parser.add_argument("--output", default="bench_report.json")
+    parser.add_argument("--baseline", help="report to compare against")
+    parser.add_argument("--threshold", type=float, default=10.0, help="allowed nodes/s drop in percent")
+    args = parser.parse_args()
+
+    report = run_benchmark(args.engines, args.depth, args.seed, args.repeats, args.min_time)
+    with open(args.output, 'w') as file:
+        json.dump(report, file, indent=2)
+
+    for name, result in report["engines"].items():
+        print(f"{name}: {result['total_nodes']} nodes in {round(result['total_time'], 2)}s, {int(result['nodes_per_second'])} nodes/s (median of {report['repeats']}+ runs per search), peak RSS {result['peak_rss_kb']} KB")
+    for name, agreement in report["best_move_agreement"].items():
+        print(f"{name} agrees with {report['reference_engine']} on {round(agreement * 100)}% of best moves")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = compare_to_baseline(report, json.load(file), args.threshold)
+        if regressions:
+            print("\n".join(regressions))
+            sys.exit(1)
@@ -4,23 +4,47 @@
 from piece import *
 from move import Move
 from game import Game
+from search_stats import SearchStats
+from time import perf_counter
+
+
+# stats of the most recent search, for anyone who didn't pass their own
+last_search_stats = None
 
 
 # returns the best move and the current evaluation. no optimizations, pure search. best depth is probably 4.
-def brute_force_best_move(game: Game, depth: int) -> tuple[Move | None, int]:
+# pass a SearchStats to get the search statistics back.
+def brute_force_best_move(game: Game, depth: int, stats: SearchStats | None = None, ply: int = 0) -> tuple[Move | None, int]:
+    global last_search_stats
+    if stats is None: stats = SearchStats()
+    if ply == 0:
+        last_search_stats = stats
+        stats.start()
+
+    stats.add_node(ply)
+
     # base case evaluates the material on the board
     if depth <= 0: 
-        return (None, game.evaluate_board_material()) # returning none looks counterintuitive, but hear me out
+        start = perf_counter()
+        evaluation = game.evaluate_board_material()
+        stats.eval_time += perf_counter() - start
+        return (None, evaluation) # returning none looks counterintuitive, but hear me out
 
     # start off with the worst possible case
     best_move_and_evaluation = (None, -100000) if game.side_to_move == PieceColor.White else (None, 100000)
 
-    for move in game.get_all_legal_moves():
+    start = perf_counter()
+    moves = game.get_all_legal_moves()
+    stats.movegen_time += perf_counter() - start
+
+    for move in moves:
         # first, make the move and save the captured piece for later
+        start = perf_counter()
         captured_piece = game.make_move(move)
+        stats.make_unmake_time += perf_counter() - start
 
         # now make a recursive call to get the best move for this current game branch
-        best_this_branch = brute_force_best_move(game, depth - 1)
+        best_this_branch = brute_force_best_move(game, depth - 1, stats, ply + 1)
 
         # if we find a move with a better rating than what we currently have, replace the current move.
         # "better rating" is more positive for white, more negative for black. however,
@@ -31,6 +55,10 @@ def brute_force_best_move(game: Game, depth: int) -> tuple[Move | None, int]:
             best_move_and_evaluation = (move, best_this_branch[1])
 
         # finally, unmake the move using the captured piece from earlier, returning the game to its original state.
+        start = perf_counter()
         game.un_make_move(move, captured_piece)
+        stats.make_unmake_time += perf_counter() - start
+
+    if ply == 0: stats.stop()
 
     return best_move_and_evaluation
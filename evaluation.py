@@ -0,0 +1,65 @@
+# material + piece-square evaluation with weights that can be tuned (see tune.py) instead of the
+# fixed 1/3/3/5/9. evaluations are in pawns from white's point of view, like evaluate_board_material.
+
+
+import json
+from game import Game
+from piece import PieceType, PieceColor, ZOBRIST_INDICES
+
+
+# the order pieces are listed in, in the weight files and in tune.py's features
+PIECE_NAMES = {
+    PieceType.Pawn: "pawn",
+    PieceType.Knight: "knight",
+    PieceType.Bishop: "bishop",
+    PieceType.Rook: "rook",
+    PieceType.Queen: "queen",
+    PieceType.King: "king"
+}
+
+
+class EvaluationWeights:
+    # material is the value of every piece but the king (which keeps its huge value so the search
+    # still notices when one is taken). piece_square has 64 bonuses per piece, a1 to h8, from
+    # white's side of the board. black uses the same tables flipped.
+    def __init__(self, material: dict[str, float], piece_square: dict[str, list[float]]):
+        self.material = material
+        self.piece_square = piece_square
+
+        # table[zobrist index][square] is what that piece on that square is worth, sign included
+        self.table = [[0.0] * 64 for _ in range(12)]
+        for (piece_type, piece_color), index in ZOBRIST_INDICES.items():
+            name = PIECE_NAMES[piece_type]
+            value = piece_type.value() if piece_type == PieceType.King else material[name]
+            for square in range(64):
+                own_square = square if piece_color == PieceColor.White else square ^ 56
+                self.table[index][square] = piece_color.value() * (value + piece_square[name][own_square])
+
+
+    # plain material with empty piece-square tables, what the engine uses without a weights file
+    @staticmethod
+    def default():
+        material = {name: piece_type.value() for piece_type, name in PIECE_NAMES.items() if piece_type != PieceType.King}
+        return EvaluationWeights(material, {name: [0.0] * 64 for name in PIECE_NAMES.values()})
+
+
+    @staticmethod
+    def from_file(path: str):
+        with open(path) as file:
+            weights = json.load(file)
+        return EvaluationWeights(weights["material"], weights["piece_square"])
+
+
+    def to_file(self, path: str):
+        with open(path, 'w') as file:
+            json.dump({"material": self.material, "piece_square": self.piece_square}, file, indent=1)
+
+
+    def evaluate(self, game: Game) -> float:
+        evaluation = 0.0
+        for row in range(8):
+            for col in range(8):
+                piece = game.board[row][col]
+                if piece is not None:
+                    evaluation += self.table[piece.zobrist_index()][row*8 + col]
+        return evaluation
@@ -1,11 +1,30 @@
 # class representation of a game
 
 
-import random
+import random, struct
 from piece import *
 from move import Move
 
 
+# one zobrist table shared by every game, so copies and decoded positions don't need a new one
+# (and the same position hashes the same in every game).
+# 768 = pieces on square, 4 = castling rights, 1 = side to move. no EP target square = todo
+zobrist_table = [random.getrandbits(64) for _ in range(768+1)]
+
+# packed position format, 32 bytes: occupancy bitboard, one nibble per occupied square (zobrist
+# index + 1, in square order), flags (side to move, castling), en passant square + 1, halfmove
+# clock, fullmove number and padding.
+PACKED_STRUCT = struct.Struct('<Q16sBBBH3x')
+
+# pieces never change once made, so decoding can share one of each instead of allocating.
+# these are in zobrist index order, so a piece's nibble is its zobrist index + 1.
+PIECES_BY_NIBBLE = [None] + [Piece(piece_type, piece_color) for piece_color in [PieceColor.White, PieceColor.Black] for piece_type in [PieceType.Pawn, PieceType.Rook, PieceType.Knight, PieceType.Bishop, PieceType.Queen, PieceType.King]]
+
+# piece letters in standard algebraic notation, and the promotion codes Move uses
+SAN_PIECES = {'N': PieceType.Knight, 'B': PieceType.Bishop, 'R': PieceType.Rook, 'Q': PieceType.Queen, 'K': PieceType.King}
+SAN_PROMOTIONS = {'Q': 1, 'R': 2, 'B': 3, 'N': 4}
+
+
 # our game only needs to know the board and whose turn it is; we will later add castling rights, 
 # en passant target squares, move count, etc, but for now this is sufficient.
 class Game: 
@@ -42,8 +61,97 @@ class Game:
                     self.board[7-row][current_column] = Piece.from_character(character)
                     current_column += 1
 
-        self.zobrist_table = [random.getrandbits(64) for _ in range(768+1)] # 768 = pieces on square, 4 = castling rights, 1 = side to move. no EP target square = todo
+        self.zobrist_table = zobrist_table
         self.zobrist_hash = self.hash()
+        self.pawn_hash = self.hash_pawns()
+
+        # an attached nnue network (see nnue.py) and its accumulators, one per move made
+        self.nnue = None
+        self.accumulators = []
+
+
+    # a cheap copy of the game, e.g. for searching a branch somewhere else. pieces are shared.
+    def copy(self):
+        game = Game.__new__(Game)
+        game.side_to_move = self.side_to_move
+        game.white_castle_kingside = self.white_castle_kingside
+        game.white_castle_queenside = self.white_castle_queenside
+        game.black_castle_kingside = self.black_castle_kingside
+        game.black_castle_queenside = self.black_castle_queenside
+        game.en_passant_target_square = self.en_passant_target_square
+        game.halfmove_clock = self.halfmove_clock
+        game.fullmove_number = self.fullmove_number
+        game.board = [row[:] for row in self.board]
+        game.zobrist_table = self.zobrist_table
+        game.zobrist_hash = self.zobrist_hash
+        game.pawn_hash = self.pawn_hash
+        game.nnue = self.nnue
+        game.accumulators = self.accumulators[-1:]
+        return game
+
+
+    # packs the whole position into 32 bytes (see PACKED_STRUCT). much smaller and faster to send
+    # between processes than a fen.
+    def to_bytes(self) -> bytes:
+        occupancy = 0
+        nibbles = []
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece:
+                    occupancy |= 1 << (row*8 + col)
+                    nibbles.append(piece.zobrist_index() + 1)
+
+        if len(nibbles) > 32:
+            raise ValueError(f"Too many pieces to pack: {len(nibbles)}")
+
+        nibbles += [0] * (32 - len(nibbles))
+        packed_pieces = bytes(nibbles[i] | nibbles[i+1] << 4 for i in range(0, 32, 2))
+
+        flags = ((self.side_to_move == PieceColor.Black)
+                 | self.white_castle_kingside << 1
+                 | self.white_castle_queenside << 2
+                 | self.black_castle_kingside << 3
+                 | self.black_castle_queenside << 4)
+
+        en_passant = 0
+        if self.en_passant_target_square and self.en_passant_target_square != '-':
+            row, col = Move.notation_to_position(self.en_passant_target_square)
+            en_passant = row*8 + col + 1
+
+        return PACKED_STRUCT.pack(occupancy, packed_pieces, flags, en_passant, min(self.halfmove_clock, 255), min(self.fullmove_number, 65535))
+
+
+    # unpacks a position made by to_bytes, without going through a fen
+    @staticmethod
+    def from_bytes(data: bytes):
+        occupancy, packed_pieces, flags, en_passant, halfmove, fullmove = PACKED_STRUCT.unpack(data)
+
+        game = Game.__new__(Game)
+        game.side_to_move = PieceColor.Black if flags & 1 else PieceColor.White
+        game.white_castle_kingside = bool(flags & 2)
+        game.white_castle_queenside = bool(flags & 4)
+        game.black_castle_kingside = bool(flags & 8)
+        game.black_castle_queenside = bool(flags & 16)
+        game.en_passant_target_square = Move.position_to_notation(divmod(en_passant - 1, 8)) if en_passant else '-'
+        game.halfmove_clock = halfmove
+        game.fullmove_number = fullmove
+
+        game.board = [[None for _ in range(8)] for _ in range(8)]
+        count = 0
+        while occupancy:
+            square = (occupancy & -occupancy).bit_length() - 1
+            nibble = packed_pieces[count >> 1] >> (4 * (count & 1)) & 15
+            game.board[square >> 3][square & 7] = PIECES_BY_NIBBLE[nibble]
+            occupancy &= occupancy - 1
+            count += 1
+
+        game.zobrist_table = zobrist_table
+        game.zobrist_hash = game.hash()
+        game.pawn_hash = game.hash_pawns()
+        game.nnue = None
+        game.accumulators = []
+        return game
 
 
     # pretty printing
@@ -83,7 +191,7 @@ class Game:
             for col in range(8):
                 piece = self.board[row][col]
                 if piece:
-                    hash = hash ^ self.zobrist_table[row*64 + col*12 + piece.zobrist_index()]
+                    hash = hash ^ self.zobrist_table[row*96 + col*12 + piece.zobrist_index()]
 
         # side to move
         if self.side_to_move == PieceColor.Black:
@@ -92,6 +200,18 @@ class Game:
         return hash
 
 
+    # zobrist hash of the pawns alone, so everything about pawn structure can be cached by it
+    # (see pawn_structure.py). kept up to date by make_move like the full hash.
+    def hash_pawns(self) -> int:
+        hash = 0
+        for row in range(8):
+            for col in range(8):
+                piece = self.board[row][col]
+                if piece and piece.piece_type == PieceType.Pawn:
+                    hash = hash ^ self.zobrist_table[row*96 + col*12 + piece.zobrist_index()]
+        return hash
+
+
     # here is our evaluation function. note that it is as simple as it gets.
     def evaluate_board_material(self) -> int:
         material = 0
@@ -127,6 +247,14 @@ class Game:
                     if row == 1 and not self.board[row+2][col]:
                         legal_moves.append(Move(location, (row+2, col)))
 
+                # captures (en passant only happens over the board, see get_strictly_legal_moves)
+                for capture_col in [col-1, col+1]:
+                    if 0 <= capture_col < 8 and self.board[row+1][capture_col] and piece.is_not_friendly_piece(self.board[row+1][capture_col]):
+                        if row+1 == 7:
+                            legal_moves += [Move(location, (row+1, capture_col), promotion=promotion_type) for promotion_type in [1, 2, 3, 4]]
+                        else:
+                            legal_moves.append(Move(location, (row+1, capture_col)))
+
             else:
                 # first push
                 if not self.board[row-1][col]:
@@ -139,6 +267,14 @@ class Game:
                     if row == 6 and not self.board[row-2][col]:
                         legal_moves.append(Move(location, (row-2, col)))
 
+                # captures
+                for capture_col in [col-1, col+1]:
+                    if 0 <= capture_col < 8 and self.board[row-1][capture_col] and piece.is_not_friendly_piece(self.board[row-1][capture_col]):
+                        if row-1 == 0:
+                            legal_moves += [Move(location, (row-1, capture_col), promotion=promotion_type) for promotion_type in [1, 2, 3, 4]]
+                        else:
+                            legal_moves.append(Move(location, (row-1, capture_col)))
+
 
         # bishop
         elif piece.piece_type == PieceType.Bishop:
@@ -224,21 +360,24 @@ class Game:
                     legal_moves.append(Move(location, (curr_row, curr_col)))
 
             
-            # check castling rights. this involves knowing if it's legal to castle
-            if self.side_to_move == PieceColor.White:
-                if self.white_castle_kingside:
+            # check castling rights. this involves knowing if it's legal to castle. make_move doesn't take
+            # the rights away when the king or a rook moves, so also check they're still where they started.
+            if self.side_to_move == PieceColor.White and location == (0, 4):
+                rook = Piece(PieceType.Rook, PieceColor.White)
+                if self.white_castle_kingside and rook.matches(self.board[0][7]):
                     if self.board[0][5] == None and self.board[0][6] == None:
                         legal_moves.append(Move(location, (0, 6)))
-                if self.white_castle_queenside:
+                if self.white_castle_queenside and rook.matches(self.board[0][0]):
                     if self.board[0][1] == None and self.board[0][2] == None and self.board[0][3] == None:
                         legal_moves.append(Move(location, (0, 2)))
 
-            else:
-                if self.black_castle_kingside:
+            elif self.side_to_move == PieceColor.Black and location == (7, 4):
+                rook = Piece(PieceType.Rook, PieceColor.Black)
+                if self.black_castle_kingside and rook.matches(self.board[7][7]):
                     if self.board[7][5] == None and self.board[7][6] == None:
                         legal_moves.append(Move(location, (7, 6)))
 
-                if self.black_castle_queenside:
+                if self.black_castle_queenside and rook.matches(self.board[7][0]):
                     if self.board[7][1] == None and self.board[7][2] == None and self.board[7][3] == None:
                         legal_moves.append(Move(location, (7, 2)))
 
@@ -260,6 +399,155 @@ class Game:
         return all_legal_moves
     
 
+    # en passant captures for the side to move, if the last move was a double pawn push
+    def get_en_passant_moves(self) -> list[Move]:
+        if not self.en_passant_target_square or self.en_passant_target_square == '-': return []
+
+        row, col = Move.notation_to_position(self.en_passant_target_square)
+        if row != (5 if self.side_to_move == PieceColor.White else 2): return []
+
+        pawn_row = row - 1 if self.side_to_move == PieceColor.White else row + 1
+        own_pawn = Piece(PieceType.Pawn, self.side_to_move)
+        return [Move((pawn_row, pawn_col), (row, col)) for pawn_col in [col-1, col+1] if 0 <= pawn_col < 8 and own_pawn.matches(self.board[pawn_row][pawn_col])]
+
+
+    def is_en_passant(self, move: Move) -> bool:
+        piece = self.board[move.start_pos[0]][move.start_pos[1]]
+        return (piece is not None and piece.piece_type == PieceType.Pawn and move.start_pos[1] != move.end_pos[1]
+                and self.board[move.end_pos[0]][move.end_pos[1]] is None)
+
+
+    def is_square_attacked(self, square: tuple[int, int], by_color: PieceColor) -> bool:
+        return any(stack[0][1].piece_color == by_color for stack in self.get_attacker_stacks(square))
+
+
+    def is_in_check(self, color: PieceColor) -> bool:
+        king = Piece(PieceType.King, color)
+        for row in range(8):
+            for col in range(8):
+                if king.matches(self.board[row][col]):
+                    return self.is_square_attacked((row, col), color.opponent())
+        return False
+
+
+    # the moves that are actually legal over the board: no leaving the king in check, no castling
+    # out of or through check, and en passant included. the search doesn't need this (taking the
+    # king settles it), but playing real games does.
+    def get_strictly_legal_moves(self) -> list[Move]:
+        return [move for move in self.get_all_legal_moves() + self.get_en_passant_moves() if self.is_legal(move)]
+
+
+    # whether a pseudo legal move (one from get_all_legal_moves or get_en_passant_moves) is legal
+    def is_legal(self, move: Move) -> bool:
+        color = self.side_to_move
+        piece = self.board[move.start_pos[0]][move.start_pos[1]]
+
+        if piece.piece_type == PieceType.King and abs(move.end_pos[1] - move.start_pos[1]) == 2:
+            passed_square = (move.start_pos[0], (move.start_pos[1] + move.end_pos[1]) // 2)
+            if self.is_square_attacked(move.start_pos, color.opponent()) or self.is_square_attacked(passed_square, color.opponent()):
+                return False
+
+        # make_move doesn't know about en passant, so take the pawn off by hand while we check
+        en_passant_pawn = None
+        if self.is_en_passant(move):
+            en_passant_pawn = self.board[move.start_pos[0]][move.end_pos[1]]
+            self.board[move.start_pos[0]][move.end_pos[1]] = None
+
+        captured_piece = self.make_move(move)
+        legal = not self.is_in_check(color)
+        self.un_make_move(move, captured_piece)
+
+        if en_passant_pawn:
+            self.board[move.start_pos[0]][move.end_pos[1]] = en_passant_pawn
+
+        return legal
+
+
+    # all pieces of both colors that attack a square, as stacks. each stack is a line of pieces
+    # along one ray out from the square, nearest first, where every piece can attack the square once
+    # the ones in front of it are gone (x-rays). knights get a stack each.
+    def get_attacker_stacks(self, square: tuple[int, int]) -> list[list[tuple[tuple[int, int], Piece]]]:
+        row, col = square
+        stacks = []
+
+        for offset in [(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (0, -1), (1, 0), (0, 1)]:
+            diagonal = offset[0] != 0 and offset[1] != 0
+            stack = []
+
+            curr_row, curr_col = row+offset[0], col+offset[1]
+            while 0 <= curr_row < 8 and 0 <= curr_col < 8:
+                piece = self.board[curr_row][curr_col]
+                if piece:
+                    adjacent = not stack and abs(curr_row - row) <= 1 and abs(curr_col - col) <= 1
+                    piece_type = piece.piece_type
+
+                    if piece_type == PieceType.Queen or piece_type == (PieceType.Bishop if diagonal else PieceType.Rook):
+                        attacks = True
+                    elif piece_type == PieceType.King:
+                        attacks = adjacent
+                    elif piece_type == PieceType.Pawn:
+                        # white pawns attack upwards, so they sit below the square (and black above)
+                        attacks = adjacent and diagonal and offset[0] == (-1 if piece.piece_color == PieceColor.White else 1)
+                    else:
+                        attacks = False
+
+                    # anything that can't attack along this ray blocks everything behind it
+                    if not attacks: break
+                    stack.append(((curr_row, curr_col), piece))
+
+                curr_row += offset[0]
+                curr_col += offset[1]
+
+            if stack: stacks.append(stack)
+
+        for offset in [(2,1), (1,2), (-1,2), (-2,1), (-2,-1), (-1,-2), (1,-2), (2,-1)]:
+            curr_row, curr_col = row+offset[0], col+offset[1]
+            if 0 <= curr_row < 8 and 0 <= curr_col < 8:
+                piece = self.board[curr_row][curr_col]
+                if piece and piece.piece_type == PieceType.Knight:
+                    stacks.append([((curr_row, curr_col), piece)])
+
+        return stacks
+
+
+    # static exchange evaluation: the material the side making this move wins (or loses, if negative)
+    # when both sides keep recapturing on the target square with their cheapest piece, and either
+    # side may stop when it's ahead. x-rays are included, and nothing is actually moved.
+    def static_exchange_evaluation(self, move: Move) -> int:
+        victim = self.board[move.end_pos[0]][move.end_pos[1]]
+        attacker = self.board[move.start_pos[0]][move.start_pos[1]]
+        stacks = self.get_attacker_stacks(move.end_pos)
+
+        # the piece making the move is at the front of its stack
+        for stack in stacks:
+            if stack[0][0] == move.start_pos:
+                stack.pop(0)
+                break
+
+        gains = [victim.piece_type.value() if victim else 0]
+        on_square = attacker.piece_type.value()
+        side = attacker.piece_color.opponent()
+
+        while True:
+            # the cheapest piece this side has at the front of a stack
+            best_stack = None
+            for stack in stacks:
+                if stack and stack[0][1].piece_color == side:
+                    if best_stack is None or stack[0][1].piece_type.value() < best_stack[0][1].piece_type.value():
+                        best_stack = stack
+            if best_stack is None: break
+
+            gains.append(on_square - gains[-1])
+            on_square = best_stack.pop(0)[1].piece_type.value()
+            side = side.opponent()
+
+        # walk back up, every side only recaptures if that's better than stopping
+        for i in range(len(gains) - 1, 0, -1):
+            gains[i-1] = -max(-gains[i-1], gains[i])
+
+        return gains[0]
+
+
     # makes a move on the given board, returns a captured piece if any.
     # also updates the zobrist hash based on the new game state.
     def make_move(self, move: Move) -> Piece | None:
@@ -283,6 +571,14 @@ class Game:
         self.board[move.start_pos[0]][move.start_pos[1]] = None
         self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[move.start_pos[0]*96 + move.start_pos[1]*12 + moving_piece.zobrist_index()]
 
+        # the pawn hash only changes when a pawn moves, promotes or is taken
+        if moving_piece.piece_type == PieceType.Pawn:
+            self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.start_pos[0]*96 + move.start_pos[1]*12 + moving_piece.zobrist_index()]
+            if move.promotion == 0:
+                self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.end_pos[0]*96 + move.end_pos[1]*12 + moving_piece.zobrist_index()]
+        if captured_piece and captured_piece.piece_type == PieceType.Pawn:
+            self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.end_pos[0]*96 + move.end_pos[1]*12 + captured_piece.zobrist_index()]
+
         # handling castling, specifically moving the rook
         # white kingside
         if moving_piece.matches(Piece(PieceType.King, PieceColor.White)) and move.start_pos == (0, 4) and move.end_pos == (0, 6):
@@ -325,6 +621,10 @@ class Game:
         self.side_to_move = self.side_to_move.opponent()
         self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[-1]
 
+        # an attached network gets the new accumulator, worked out from the previous one
+        if self.nnue is not None:
+            self.accumulators.append(self.nnue.updated(self.accumulators[-1], move, moving_piece, self.board[move.end_pos[0]][move.end_pos[1]], captured_piece))
+
         return captured_piece
 
 
@@ -353,6 +653,15 @@ class Game:
             self.board[move.end_pos[0]][move.end_pos[1]] = captured_piece
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[move.end_pos[0]*96 + move.end_pos[1]*12 + captured_piece.zobrist_index()]
 
+        # undo the pawn hash the same way
+        pawn = self.board[move.start_pos[0]][move.start_pos[1]]
+        if pawn.piece_type == PieceType.Pawn:
+            self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.start_pos[0]*96 + move.start_pos[1]*12 + pawn.zobrist_index()]
+            if move.promotion == 0:
+                self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.end_pos[0]*96 + move.end_pos[1]*12 + pawn.zobrist_index()]
+        if captured_piece and captured_piece.piece_type == PieceType.Pawn:
+            self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.end_pos[0]*96 + move.end_pos[1]*12 + captured_piece.zobrist_index()]
+
         # handling castling, specifically moving the rook back
         # white kingside
         if moving_piece.matches(Piece(PieceType.King, PieceColor.White)) and move.start_pos == (0, 4) and move.end_pos == (0, 6):
@@ -361,7 +670,7 @@ class Game:
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[0*96 + 7*12 + rook.zobrist_index()]
             self.board[0][5] = None
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[0*96 + 5*12 + rook.zobrist_index()]
-            self.white_castle_kingside = False
+            self.white_castle_kingside = True # we could only have castled if we still had the right
         
         # white queenside
         elif moving_piece.matches(Piece(PieceType.King, PieceColor.White)) and move.start_pos == (0, 4) and move.end_pos == (0, 2):
@@ -370,7 +679,7 @@ class Game:
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[0*96 + 0*12 + rook.zobrist_index()]
             self.board[0][3] = None
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[0*96 + 3*12 + rook.zobrist_index()]
-            self.white_castle_queenside = False
+            self.white_castle_queenside = True # we could only have castled if we still had the right
 
         # black kingside
         elif moving_piece.matches(Piece(PieceType.King, PieceColor.Black)) and move.start_pos == (7, 4) and move.end_pos == (7, 6):
@@ -379,7 +688,7 @@ class Game:
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[7*96 + 7*12 + rook.zobrist_index()]
             self.board[7][5] = None
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[7*96 + 5*12 + rook.zobrist_index()]
-            self.black_castle_kingside = False
+            self.black_castle_kingside = True # we could only have castled if we still had the right
 
         # black queenside
         elif moving_piece.matches(Piece(PieceType.King, PieceColor.Black)) and move.start_pos == (7, 4) and move.end_pos == (7, 2):
@@ -388,13 +697,152 @@ class Game:
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[7*96 + 0*12 + rook.zobrist_index()]
             self.board[7][3] = None
             self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[7*96 + 3*12 + rook.zobrist_index()]
-            self.black_castle_queenside = False
+            self.black_castle_queenside = True # we could only have castled if we still had the right
 
 
         # change back the player to move 
         self.side_to_move = self.side_to_move.opponent()
         self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[-1]
 
+        # the accumulator from before the move is still underneath
+        if self.nnue is not None:
+            self.accumulators.pop()
+
+
+    # plays a move over the board. on top of make_move this takes en passant pawns off, keeps the
+    # castling rights, en passant square and move clocks up to date. this can't be un-made, use it
+    # for playing games, not for searching.
+    def play_move(self, move: Move) -> Piece | None:
+        moving_piece = self.board[move.start_pos[0]][move.start_pos[1]]
+        color = moving_piece.piece_color
+        en_passant = self.is_en_passant(move)
+
+        captured_piece = self.make_move(move)
+
+        if en_passant:
+            captured_piece = self.board[move.start_pos[0]][move.end_pos[1]]
+            self.board[move.start_pos[0]][move.end_pos[1]] = None
+            self.zobrist_hash = self.zobrist_hash ^ self.zobrist_table[move.start_pos[0]*96 + move.end_pos[1]*12 + captured_piece.zobrist_index()]
+            self.pawn_hash = self.pawn_hash ^ self.zobrist_table[move.start_pos[0]*96 + move.end_pos[1]*12 + captured_piece.zobrist_index()]
+            if self.nnue is not None:
+                self.accumulators[-1] = self.nnue.removed(self.accumulators[-1], captured_piece, (move.start_pos[0], move.end_pos[1]))
+
+        # a king move loses both castling rights, a rook leaving (or being taken on) its corner one
+        if moving_piece.piece_type == PieceType.King:
+            if color == PieceColor.White:
+                self.white_castle_kingside = self.white_castle_queenside = False
+            else:
+                self.black_castle_kingside = self.black_castle_queenside = False
+        for square in [move.start_pos, move.end_pos]:
+            if square == (0, 0): self.white_castle_queenside = False
+            elif square == (0, 7): self.white_castle_kingside = False
+            elif square == (7, 0): self.black_castle_queenside = False
+            elif square == (7, 7): self.black_castle_kingside = False
+
+        if moving_piece.piece_type == PieceType.Pawn and abs(move.end_pos[0] - move.start_pos[0]) == 2:
+            self.en_passant_target_square = Move.position_to_notation(((move.start_pos[0] + move.end_pos[0]) // 2, move.start_pos[1]))
+        else:
+            self.en_passant_target_square = '-'
+
+        if moving_piece.piece_type == PieceType.Pawn or captured_piece:
+            self.halfmove_clock = 0
+        else:
+            self.halfmove_clock += 1
+        if color == PieceColor.Black:
+            self.fullmove_number += 1
+
+        return captured_piece
+
+
+    # standard algebraic notation for a legal move, e.g. "Nbd7", "exd5", "e8=Q+", "O-O"
+    def move_to_san(self, move: Move, legal_moves: list[Move] | None = None) -> str:
+        piece = self.board[move.start_pos[0]][move.start_pos[1]]
+
+        if piece.piece_type == PieceType.King and abs(move.end_pos[1] - move.start_pos[1]) == 2:
+            san = "O-O" if move.end_pos[1] == 6 else "O-O-O"
+        else:
+            if legal_moves is None: legal_moves = self.get_strictly_legal_moves()
+            is_capture = self.board[move.end_pos[0]][move.end_pos[1]] is not None or self.is_en_passant(move)
+            start, end = Move.position_to_notation(move.start_pos), Move.position_to_notation(move.end_pos)
+
+            if piece.piece_type == PieceType.Pawn:
+                san = (start[0] + "x" if is_capture else "") + end
+                if move.promotion: san += "=" + Piece(Move.promotion_to_piecetype(move.promotion), PieceColor.White).to_character()
+            else:
+                san = piece.to_character().upper()
+
+                # say which piece if another one of the same kind could go there too
+                others = [other.start_pos for other in legal_moves if other.end_pos == move.end_pos and other.start_pos != move.start_pos
+                          and piece.matches(self.board[other.start_pos[0]][other.start_pos[1]])]
+                if others:
+                    if all(other[1] != move.start_pos[1] for other in others): san += start[0]
+                    elif all(other[0] != move.start_pos[0] for other in others): san += start[1]
+                    else: san += start
+
+                san += ("x" if is_capture else "") + end
+
+        after = self.copy()
+        after.play_move(move)
+        if after.is_in_check(after.side_to_move):
+            san += "#" if not after.get_strictly_legal_moves() else "+"
+
+        return san
+
+
+    # the legal move a san string like "Nbd7", "exd5", "e8=Q+" or "O-O" stands for. only the pieces
+    # the san could mean get their moves generated, and legality is only checked when more than one
+    # of them can get there (pgn files are trusted to only have legal moves in them otherwise).
+    def move_from_san(self, san: str) -> Move:
+        text = san.rstrip('+#!?')
+        color = self.side_to_move
+        home_row = 0 if color == PieceColor.White else 7
+
+        if text in ["O-O", "0-0", "O-O-O", "0-0-0"]:
+            move = Move((home_row, 4), (home_row, 6 if len(text) == 3 else 2))
+            king = self.board[home_row][4]
+            if king is None or not king.matches(Piece(PieceType.King, color)) or move not in self.get_piece_legal_moves((home_row, 4)):
+                raise ValueError(f"Illegal move: {san}")
+            return move
+
+        promotion = 0
+        if "=" in text:
+            text, promoted = text.split("=", 1)
+            promotion = SAN_PROMOTIONS.get(promoted[:1].upper(), 0)
+        elif len(text) > 2 and text[-1] in SAN_PROMOTIONS and text[-2].isdigit():
+            text, promotion = text[:-1], SAN_PROMOTIONS[text[-1]]
+
+        piece_type = SAN_PIECES.get(text[:1], PieceType.Pawn)
+        if piece_type != PieceType.Pawn: text = text[1:]
+        text = text.replace("x", "").replace(":", "").replace("-", "")
+        if len(text) < 2: raise ValueError(f"Invalid move: {san}")
+
+        # the target and any disambiguating file/rank have to be on the board before we index with them
+        disambiguation = text[:-2]
+        from_col = ord(disambiguation[0]) - ord('a') if disambiguation[:1].isalpha() else None
+        from_row = ord(disambiguation[-1]) - ord('1') if disambiguation[-1:].isdigit() else None
+        if text[-2] not in "abcdefgh" or text[-1] not in "12345678" or len(disambiguation) > 2 \
+                or (from_col is not None and not 0 <= from_col < 8) or (from_row is not None and not 0 <= from_row < 8) \
+                or len(disambiguation) > (from_col is not None) + (from_row is not None):
+            raise ValueError(f"Invalid move: {san}")
+        target = Move.notation_to_position(text[-2:])
+
+        piece = Piece(piece_type, color)
+        candidates = []
+        for row in range(8) if from_row is None else [from_row]:
+            for col in range(8) if from_col is None else [from_col]:
+                if not piece.matches(self.board[row][col]): continue
+                candidates += [move for move in self.get_piece_legal_moves((row, col)) if move.end_pos == target and move.promotion == promotion]
+
+        if piece_type == PieceType.Pawn:
+            candidates += [move for move in self.get_en_passant_moves() if move.end_pos == target and (from_col is None or move.start_pos[1] == from_col)]
+
+        if len(candidates) > 1:
+            candidates = [move for move in candidates if self.is_legal(move)]
+        if len(candidates) != 1:
+            raise ValueError(f"{'Ambiguous' if candidates else 'Illegal'} move: {san}")
+
+        return candidates[0]
+
 
     # converts to a fen string (some issues with last few bits but board/side is accurate)
     def to_fen(self) -> str:
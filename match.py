@@ -0,0 +1,326 @@
+# self-play matches between two engine settings. games run in parallel on worker processes, every
+# opening is played twice with colors swapped, finished games are appended to a pgn file and the
+# match stops early once a sequential probability ratio test (sprt) can tell the two apart.
+#
+#   python match.py --engine name=new,depth=5 --engine name=old,depth=4 --tc 10+0.1 --games 400
+#   python match.py --engine name=a,nodes=20000 --engine name=b,nodes=10000 --elo0 0 --elo1 10
+#   python match.py --engine name=tuned,depth=3,weights=eval_weights.json --engine name=material,depth=3
+
+
+import argparse, math, os, time
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from game import Game
+from piece import PieceColor, PieceType
+from polyglot import polyglot_key
+from tablebase import Tablebase
+from evaluation import EvaluationWeights
+import optimized_engine
+
+
+# a handful of balanced, well known openings a few moves in
+DEFAULT_OPENINGS = [
+    "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1",
+    "r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3",
+    "rnbqkb1r/pppp1ppp/5n2/4p3/2P5/2N5/PP1PPPPP/R1BQKBNR w KQkq - 2 3",
+    "rnbqkbnr/pp1ppppp/8/2p5/4P3/5N2/PPPP1PPP/RNBQKB1R b KQkq - 1 2",
+    "rnbqkbnr/ppp1pppp/8/3p4/2PP4/8/PP2PPPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkbnr/pp2pppp/2p5/3p4/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 3",
+    "rnbqkbnr/pppp1ppp/4p3/8/3PP3/8/PPP2PPP/RNBQKBNR b KQkq - 0 2",
+    "rnbqkb1r/pppppp1p/5np1/8/2PP4/8/PP2PPPP/RNBQKBNR w KQkq - 0 3"
+]
+
+MAX_MOVES = 300     # plies, after which a game is called a draw
+
+
+# one side of the match. an engine without a depth, time control or node limit searches to depth 4.
+# weights is an evaluation weights file (see tune.py), without one the engine counts material.
+class EngineConfig:
+    def __init__(self, name: str, depth: int | None = None, nodes: int | None = None, tablebases: str | None = None, weights: str | None = None):
+        self.name = name
+        self.depth = depth
+        self.nodes = nodes
+        self.tablebases = tablebases
+        self.weights = weights
+
+
+    # "name=new,depth=5,nodes=20000,tablebases=tablebases,weights=eval_weights.json"
+    @staticmethod
+    def from_spec(spec: str):
+        fields = dict(field.split("=", 1) for field in spec.split(","))
+        return EngineConfig(fields.get("name", spec), int(fields["depth"]) if "depth" in fields else None,
+                            int(fields["nodes"]) if "nodes" in fields else None, fields.get("tablebases"), fields.get("weights"))
+
+
+# each worker process opens every tablebase directory and weights file it is asked for once and keeps it
+worker_tablebases = {}
+worker_weights = {}
+
+
+def load_tablebase(directory: str | None) -> Tablebase | None:
+    if not directory or not os.path.isdir(directory): return None
+    if directory not in worker_tablebases:
+        worker_tablebases[directory] = Tablebase(directory)
+    return worker_tablebases[directory]
+
+
+def load_weights(path: str | None) -> EvaluationWeights | None:
+    if not path: return None
+    if path not in worker_weights:
+        worker_weights[path] = EvaluationWeights.from_file(path)
+    return worker_weights[path]
+
+
+def is_insufficient_material(game: Game) -> bool:
+    minor_pieces = 0
+    for row in game.board:
+        for piece in row:
+            if piece is None or piece.piece_type == PieceType.King: continue
+            if piece.piece_type not in [PieceType.Bishop, PieceType.Knight]: return False
+            minor_pieces += 1
+    return minor_pieces <= 1
+
+
+# the result ("1-0", "0-1", "1/2-1/2") and why, or None if the game goes on
+def adjudicate(game: Game, legal_moves: list, repetitions: dict, num_plies: int) -> tuple[str, str] | None:
+    if not legal_moves:
+        if game.is_in_check(game.side_to_move):
+            return ("0-1" if game.side_to_move == PieceColor.White else "1-0", "checkmate")
+        return ("1/2-1/2", "stalemate")
+    if game.halfmove_clock >= 100: return ("1/2-1/2", "fifty move rule")
+    if repetitions.get(polyglot_key(game), 0) >= 3: return ("1/2-1/2", "threefold repetition")
+    if is_insufficient_material(game): return ("1/2-1/2", "insufficient material")
+    if num_plies >= MAX_MOVES: return ("1/2-1/2", "move limit")
+    return None
+
+
+# runs in a worker process. plays one game and returns its result and pgn. with a time control each
+# side has a clock (seconds, with an increment per move) and loses if it runs out.
+def play_game(white: EngineConfig, black: EngineConfig, opening_fen: str, round_number: int, base_time: float | None, increment: float) -> dict:
+    game = Game(opening_fen)
+    engines = {PieceColor.White: white, PieceColor.Black: black}
+    clocks = {PieceColor.White: base_time, PieceColor.Black: base_time}
+    repetitions = {polyglot_key(game): 1}
+    san_moves = []
+    starting_number, starting_side = game.fullmove_number, game.side_to_move
+
+    while True:
+        legal_moves = game.get_strictly_legal_moves()
+        outcome = adjudicate(game, legal_moves, repetitions, len(san_moves))
+        if outcome: break
+
+        color = game.side_to_move
+        config = engines[color]
+
+        # spend about a twentieth of what's left, never more than half of it
+        time_limit = None
+        if base_time is not None:
+            time_limit = min(clocks[color] / 20 + increment, clocks[color] / 2)
+        depth = config.depth if config.depth or config.nodes or time_limit else 4
+
+        # every search starts cold so the two engines can't use each other's table
+        optimized_engine.transposition_table.clear()
+        start = time.perf_counter()
+        weights = load_weights(config.weights)
+        move, _, _ = optimized_engine.limited_engine(game, depth, time_limit, config.nodes, tablebase=load_tablebase(config.tablebases),
+                                                     evaluate=weights.evaluate if weights else None)
+        elapsed = time.perf_counter() - start
+
+        if base_time is not None:
+            clocks[color] -= elapsed
+            if clocks[color] < 0:
+                outcome = ("0-1" if color == PieceColor.White else "1-0", f"{config.name} lost on time")
+                break
+            clocks[color] += increment
+
+        if move not in legal_moves:
+            outcome = ("0-1" if color == PieceColor.White else "1-0", f"{config.name} played an illegal move {move}")
+            break
+
+        san_moves.append(game.move_to_san(move, legal_moves))
+        game.play_move(move)
+
+        key = polyglot_key(game)
+        repetitions[key] = repetitions.get(key, 0) + 1
+
+    result, reason = outcome
+    return {
+        "white": white.name,
+        "black": black.name,
+        "result": result,
+        "reason": reason,
+        "plies": len(san_moves),
+        "pgn": to_pgn(white.name, black.name, opening_fen, round_number, san_moves, starting_number, starting_side, result, reason)
+    }
+
+
+def to_pgn(white: str, black: str, fen: str, round_number: int, san_moves: list[str], starting_number: int, starting_side: PieceColor, result: str, reason: str) -> str:
+    tags = [
+        ("Event", "Self-play match"),
+        ("Site", "?"),
+        ("Date", time.strftime("%Y.%m.%d")),
+        ("Round", str(round_number)),
+        ("White", white),
+        ("Black", black),
+        ("Result", result),
+        ("SetUp", "1"),
+        ("FEN", fen),
+        ("Termination", reason)
+    ]
+
+    tokens = []
+    number, side = starting_number, starting_side
+    for i, san in enumerate(san_moves):
+        if side == PieceColor.White:
+            tokens.append(f"{number}.")
+        elif i == 0:
+            tokens.append(f"{number}...")
+        tokens.append(san)
+        if side == PieceColor.Black: number += 1
+        side = side.opponent()
+    tokens.append(result)
+
+    # movetext lines are kept under 80 characters
+    lines, line = [], ""
+    for token in tokens:
+        if line and len(line) + len(token) + 1 > 79:
+            lines.append(line)
+            line = token
+        else:
+            line = f"{line} {token}" if line else token
+    lines.append(line)
+
+    return "".join(f'[{name} "{value}"]\n' for name, value in tags) + "\n" + "\n".join(lines) + "\n\n"
+
+
+# score of the first engine from its point of view: 1 for a win, 0.5 for a draw
+def score_for(name: str, game_result: dict) -> float:
+    if game_result["result"] == "1/2-1/2": return 0.5
+    white_won = game_result["result"] == "1-0"
+    return 1.0 if white_won == (game_result["white"] == name) else 0.0
+
+
+def elo_to_score(elo: float) -> float:
+    return 1 / (1 + 10 ** (-elo / 400))
+
+
+def score_to_elo(score: float) -> float:
+    score = min(max(score, 1e-6), 1 - 1e-6)
+    return -400 * math.log10(1 / score - 1)
+
+
+# generalized sprt log likelihood ratio (normal approximation) of elo1 against elo0 given wins,
+# draws and losses. the test is done once it leaves (lower, upper) from sprt_bounds.
+def sprt_llr(wins: int, draws: int, losses: int, elo0: float, elo1: float) -> float:
+    games = wins + draws + losses
+    if games == 0 or wins + losses == 0: return 0.0
+
+    score = (wins + draws / 2) / games
+    variance = (wins * (1 - score) ** 2 + draws * (0.5 - score) ** 2 + losses * score ** 2) / games
+    if variance <= 0: return 0.0
+
+    score0, score1 = elo_to_score(elo0), elo_to_score(elo1)
+    return games * (score1 - score0) * (2 * score - score0 - score1) / (2 * variance)
+
+
+def sprt_bounds(alpha: float, beta: float) -> tuple[float, float]:
+    return (math.log(beta / (1 - alpha)), math.log((1 - beta) / alpha))
+
+
+def load_openings(path: str | None) -> list[str]:
+    if not path: return DEFAULT_OPENINGS
+    with open(path) as file:
+        return [line.strip() for line in file if line.strip() and not line.startswith("#")]
+
+
+# plays up to max_games games between first and second and returns the final standings. the sprt
+# checks after every finished game and cancels the games that haven't started once it decides.
+def run_match(first: EngineConfig, second: EngineConfig, openings: list[str], max_games: int, base_time: float | None = None, increment: float = 0.0,
+              num_workers: int = os.cpu_count() or 1, pgn_path: str | None = "match.pgn", elo0: float = 0.0, elo1: float = 10.0,
+              alpha: float = 0.05, beta: float = 0.05) -> dict:
+    lower, upper = sprt_bounds(alpha, beta)
+    wins, draws, losses = 0, 0, 0
+    llr, decision = 0.0, None
+    pgn_file = open(pgn_path, 'a') if pgn_path else None
+
+    # every opening twice, once with each engine playing white
+    schedule = []
+    for i in range(max_games):
+        opening = openings[(i // 2) % len(openings)]
+        white, black = (first, second) if i % 2 == 0 else (second, first)
+        schedule.append((white, black, opening, i + 1))
+
+    with ProcessPoolExecutor(num_workers) as pool:
+        pending = {pool.submit(play_game, white, black, opening, round_number, base_time, increment) for white, black, opening, round_number in schedule}
+
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                game_result = future.result()
+                score = score_for(first.name, game_result)
+                if score == 1.0: wins += 1
+                elif score == 0.5: draws += 1
+                else: losses += 1
+
+                if pgn_file:
+                    pgn_file.write(game_result["pgn"])
+                    pgn_file.flush()
+
+                llr = sprt_llr(wins, draws, losses, elo0, elo1)
+                print(f"{wins + draws + losses} games: +{wins} ={draws} -{losses}  LLR {llr:.2f} ({lower:.2f}, {upper:.2f})  "
+                      f"{game_result['white']} vs {game_result['black']} {game_result['result']} ({game_result['reason']})", flush=True)
+
+            if llr <= lower: decision = "H0"
+            elif llr >= upper: decision = "H1"
+            if decision:
+                for future in pending: future.cancel()
+                break
+
+    if pgn_file: pgn_file.close()
+
+    games = wins + draws + losses
+    return {
+        "games": games,
+        "wins": wins,
+        "draws": draws,
+        "losses": losses,
+        "score": (wins + draws / 2) / games if games else None,
+        "elo": score_to_elo((wins + draws / 2) / games) if games else None,
+        "llr": llr,
+        "sprt": decision
+    }
+
+
+# "10+0.1" is 10 seconds per game and 0.1 seconds added per move
+def parse_time_control(time_control: str | None) -> tuple[float | None, float]:
+    if not time_control: return (None, 0.0)
+    base, _, increment = time_control.partition("+")
+    return (float(base), float(increment or 0))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="self-play match between two engine settings")
+    parser.add_argument("--engine", action="append", required=True, help="name=...,depth=...,nodes=...,tablebases=... (give two)")
+    parser.add_argument("--tc", help="time control as seconds+increment, e.g. 10+0.1")
+    parser.add_argument("--games", type=int, default=200)
+    parser.add_argument("--openings", help="file with one fen per line")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--pgn", default="match.pgn")
+    parser.add_argument("--elo0", type=float, default=0.0)
+    parser.add_argument("--elo1", type=float, default=10.0)
+    parser.add_argument("--alpha", type=float, default=0.05)
+    parser.add_argument("--beta", type=float, default=0.05)
+    args = parser.parse_args()
+
+    if len(args.engine) != 2:
+        parser.error("a match needs exactly two --engine settings")
+
+    first, second = EngineConfig.from_spec(args.engine[0]), EngineConfig.from_spec(args.engine[1])
+    base_time, increment = parse_time_control(args.tc)
+
+    summary = run_match(first, second, load_openings(args.openings), args.games, base_time, increment, args.workers, args.pgn,
+                        args.elo0, args.elo1, args.alpha, args.beta)
+
+    print(f"{first.name} vs {second.name}: +{summary['wins']} ={summary['draws']} -{summary['losses']} in {summary['games']} games")
+    if summary["games"]:
+        print(f"score {summary['score']:.3f}, elo difference {summary['elo']:+.1f}")
+    print(f"SPRT: {'accepted ' + summary['sprt'] if summary['sprt'] else 'no decision'} (LLR {summary['llr']:.2f})")
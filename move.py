@@ -11,6 +11,16 @@ class Move:
         self.promotion = promotion # 1 is queen, 2 is rook, 3 is bishop, 4 is knight
 
 
+    # two moves are the same if they go from and to the same squares with the same promotion
+    def __eq__(self, other):
+        if not isinstance(other, Move): return False
+        return self.start_pos == other.start_pos and self.end_pos == other.end_pos and self.promotion == other.promotion
+
+
+    def __hash__(self):
+        return hash((self.start_pos, self.end_pos, self.promotion))
+
+
     # will print move in UCI format, e.g. "e2e4" or "b8c6"
     def __str__(self):
         return self.position_to_notation(self.start_pos) + self.position_to_notation(self.end_pos) + self.promotion_to_notation(self.promotion)
@@ -29,7 +39,7 @@ class Move:
         elif promotion == 1: return "q"
         elif promotion == 2: return "r"
         elif promotion == 3: return "b"
-        elif promotion == 4: return "k"
+        elif promotion == 4: return "n"
 
 
     @staticmethod 
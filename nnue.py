@@ -0,0 +1,138 @@
+# efficiently updatable neural network evaluation (nnue). the input is 768 sparse features, one per
+# (piece, square), and the first layer's output (the accumulator) is kept up to date as moves are
+# made: a move only adds and subtracts a few weight rows instead of running the layer again. after
+# that a small dense head turns the accumulator into an evaluation, in pawns from white's view.
+#
+#   768 -> HIDDEN_SIZE (int16, clipped relu) -> HEAD_SIZE (int8, clipped relu) -> 1 (int8)
+#
+# weights are stored quantised: activations are scaled by QA and dense weights by QB, so the whole
+# forward pass is integer arithmetic. train_nnue.py trains a network and writes one of these files.
+#
+#   network = Network.from_file("nnue.npz")
+#   network.attach(game)
+#   optimized_engine.optimized_engine(game, 4, evaluate=network.evaluate)
+
+
+import numpy as np
+from game import Game
+from move import Move
+from piece import Piece, PieceType, ZOBRIST_INDICES
+
+
+NUM_FEATURES = 12 * 64
+HIDDEN_SIZE = 128
+HEAD_SIZE = 32
+
+QA = 127        # a clipped activation of 1.0 is QA
+QB = 64         # a dense weight of 1.0 is QB
+
+# taking a king ends the game, the network never sees positions like that
+KING_VALUE = PieceType.King.value()
+
+
+# the input feature of a piece on a square: its zobrist index picks the block of 64
+def feature_index(piece: Piece, square: tuple[int, int]) -> int:
+    return piece.zobrist_index() * 64 + square[0] * 8 + square[1]
+
+
+class Network:
+    # weights as they are stored: w1 (768, HIDDEN_SIZE) and b1 int16, w2 (HIDDEN_SIZE, HEAD_SIZE)
+    # int8, b2 int32, w3 (HEAD_SIZE,) int8 and b3 int32
+    def __init__(self, w1: np.ndarray, b1: np.ndarray, w2: np.ndarray, b2: np.ndarray, w3: np.ndarray, b3: np.ndarray):
+        self.w1 = w1.astype(np.int16)
+        self.b1 = b1.astype(np.int16)
+        self.w2 = w2.astype(np.int8)
+        self.b2 = b2.astype(np.int32)
+        self.w3 = w3.astype(np.int8)
+        self.b3 = np.int32(b3)
+
+        # the head is so small that it's quicker to keep int32 copies than to widen every time
+        self.w2_wide = self.w2.astype(np.int32)
+        self.w3_wide = self.w3.astype(np.int32)
+
+
+    # rounds float weights (the way train_nnue.py has them) onto the integer grid
+    @staticmethod
+    def quantize(w1: np.ndarray, b1: np.ndarray, w2: np.ndarray, b2: np.ndarray, w3: np.ndarray, b3: float):
+        return Network(np.round(w1 * QA), np.round(b1 * QA),
+                       np.clip(np.round(w2 * QB), -127, 127), np.round(b2 * QA * QB),
+                       np.clip(np.round(w3 * QB), -127, 127), np.round(b3 * QA * QB))
+
+
+    @staticmethod
+    def from_file(path: str):
+        weights = np.load(path)
+        return Network(weights["w1"], weights["b1"], weights["w2"], weights["b2"], weights["w3"], weights["b3"])
+
+
+    def to_file(self, path: str):
+        np.savez(path, w1=self.w1, b1=self.b1, w2=self.w2, b2=self.b2, w3=self.w3, b3=self.b3)
+
+
+    # an accumulator goes with the balance of kings on the board (+1 for white's, -1 for black's),
+    # so a search that takes a king still sees the game is over. both are only ever replaced, never
+    # changed, so copies of games can share them.
+    def refresh(self, game: Game) -> tuple[np.ndarray, int]:
+        features = []
+        king_balance = 0
+        for row in range(8):
+            for col in range(8):
+                piece = game.board[row][col]
+                if piece is not None:
+                    features.append(feature_index(piece, (row, col)))
+                    if piece.piece_type == PieceType.King: king_balance += piece.piece_color.value()
+
+        accumulator = self.b1 + self.w1[features].sum(axis=0, dtype=np.int16)
+        return (accumulator, king_balance)
+
+
+    # from now on the game keeps an accumulator for this network through make_move and un_make_move
+    def attach(self, game: Game):
+        game.nnue = self
+        game.accumulators = [self.refresh(game)]
+
+
+    # the accumulator after a move, from the one before it. called by Game.make_move with the piece
+    # that moved, the piece now on the end square (different after a promotion) and what was taken.
+    def updated(self, entry: tuple[np.ndarray, int], move: Move, moving_piece: Piece, placed_piece: Piece, captured_piece: Piece | None) -> tuple[np.ndarray, int]:
+        accumulator, king_balance = entry
+        accumulator = accumulator + self.w1[feature_index(placed_piece, move.end_pos)] - self.w1[feature_index(moving_piece, move.start_pos)]
+
+        if captured_piece is not None:
+            accumulator -= self.w1[feature_index(captured_piece, move.end_pos)]
+            if captured_piece.piece_type == PieceType.King: king_balance -= captured_piece.piece_color.value()
+
+        # castling moves the rook too
+        if moving_piece.piece_type == PieceType.King and abs(move.end_pos[1] - move.start_pos[1]) == 2:
+            rook = ZOBRIST_INDICES[(PieceType.Rook, moving_piece.piece_color)] * 64 + move.start_pos[0] * 8
+            if move.end_pos[1] == 6:
+                accumulator += self.w1[rook + 5] - self.w1[rook + 7]
+            else:
+                accumulator += self.w1[rook + 3] - self.w1[rook + 0]
+
+        return (accumulator, king_balance)
+
+
+    # the accumulator with one piece taken off, for en passant captures in Game.play_move
+    def removed(self, entry: tuple[np.ndarray, int], piece: Piece, square: tuple[int, int]) -> tuple[np.ndarray, int]:
+        accumulator, king_balance = entry
+        return (accumulator - self.w1[feature_index(piece, square)], king_balance)
+
+
+    # the dense head, all in integers. the result is in pawns.
+    def forward(self, accumulator: np.ndarray) -> float:
+        hidden = np.clip(accumulator, 0, QA).astype(np.int32)
+        head = np.clip((hidden @ self.w2_wide + self.b2) // QB, 0, QA)
+        return float(head @ self.w3_wide + self.b3) / (QA * QB)
+
+
+    # evaluation of the game, from its own accumulator if this network is attached to it. anything
+    # else gets a full refresh, which is much slower.
+    def evaluate(self, game: Game) -> float:
+        if game.nnue is self:
+            accumulator, king_balance = game.accumulators[-1]
+        else:
+            accumulator, king_balance = self.refresh(game)
+
+        if king_balance != 0: return king_balance * KING_VALUE
+        return self.forward(accumulator)
@@ -1,73 +1,402 @@
-# brute force recursive engine
+# alpha-beta recursive engine with a transposition table and quiescence search
 
 
 from piece import *
 from move import Move
 from game import Game
+from tablebase import Tablebase, ILLEGAL
+from search_stats import SearchStats
+from analysis_cache import AnalysisCache, BOUND_EXACT, BOUND_LOWER, BOUND_UPPER
+from time import perf_counter
+from typing import Callable
 
 
+# zobrist hash -> (depth, evaluation, bound, best move)
 transposition_table = {}
 
-# returns the best move and the current evaluation. no optimizations, pure search. best depth is probably 4.
-def minimax(game: Game, depth: int) -> int:
+# stats of the most recent optimized_engine search, for anyone who didn't pass their own
+last_search_stats = None
+
+
+# raised inside a search that runs out of time or nodes
+class SearchAborted(Exception):
+    pass
+
+
+# everything a single search can use besides the game itself
+class SearchContext:
+    def __init__(self, tablebase: Tablebase | None = None, stats: SearchStats | None = None, deadline: float | None = None, node_limit: int | None = None,
+                 evaluate: Callable[[Game], float] | None = None):
+        self.tablebase = tablebase
+        self.stats = stats or SearchStats()
+        self.evaluate = evaluate or Game.evaluate_board_material     # static evaluation, e.g. EvaluationWeights.evaluate
+        self.deadline = deadline        # perf_counter() time to stop at
+        self.node_limit = node_limit
+
+
+    # stops the search (by raising SearchAborted) once we are out of nodes or time. the clock is
+    # only read every 256 nodes.
+    def check_limits(self):
+        if self.node_limit is not None and self.stats.nodes >= self.node_limit:
+            raise SearchAborted()
+        if self.deadline is not None and self.stats.nodes & 255 == 0 and perf_counter() >= self.deadline:
+            raise SearchAborted()
+
+
+# taking a king ends the game, quiescence doesn't look any further once one is gone
+KING_VALUE = PieceType.King.value()
+
+
+# the order we try moves in: the transposition table's best move, then captures that don't lose
+# material (best first), then quiet moves, then captures that do lose material.
+def order_moves(game: Game, moves: list[Move], tt_move: Move | None) -> list[Move]:
+    scored_moves = []
+    for move in moves:
+        if move == tt_move:
+            score = 100000
+        elif game.board[move.end_pos[0]][move.end_pos[1]]:
+            see = game.static_exchange_evaluation(move)
+            score = 1000 + see if see >= 0 else -1000 + see
+        else:
+            score = 0
+        scored_moves.append((score, move))
+
+    scored_moves.sort(key=lambda scored_move: scored_move[0], reverse=True)
+    return [move for _, move in scored_moves]
+
+
+# searches captures only, until the position is quiet, so we never stop right in the middle of an
+# exchange. captures that lose material by static exchange evaluation aren't searched at all.
+def quiescence(game: Game, alpha: int, beta: int, context: SearchContext, ply: int) -> int:
+    stats = context.stats
+    stats.add_node(ply, quiescence=True)
+    context.check_limits()
+
+    start = perf_counter()
+    stand_pat = context.evaluate(game)
+    stats.eval_time += perf_counter() - start
+
+    # once a king is gone the game is over, there is nothing left to capture for
+    if abs(stand_pat) >= KING_VALUE // 2: return stand_pat
+
+    # the side to move can always decline to capture, so the static evaluation is a bound
+    maximizing = game.side_to_move == PieceColor.White
+    if maximizing:
+        if stand_pat >= beta: return stand_pat
+        alpha = max(alpha, stand_pat)
+    else:
+        if stand_pat <= alpha: return stand_pat
+        beta = min(beta, stand_pat)
+
+    start = perf_counter()
+    captures = []
+    for move in game.get_all_legal_moves():
+        if game.board[move.end_pos[0]][move.end_pos[1]]:
+            see = game.static_exchange_evaluation(move)
+            if see >= 0: captures.append((see, move))
+    captures.sort(key=lambda capture: capture[0], reverse=True)
+    stats.movegen_time += perf_counter() - start
+
+    best_evaluation = stand_pat
+    for index, (_, move) in enumerate(captures):
+        start = perf_counter()
+        captured_piece = game.make_move(move)
+        stats.make_unmake_time += perf_counter() - start
+
+        evaluation = quiescence(game, alpha, beta, context, ply + 1)
+
+        start = perf_counter()
+        game.un_make_move(move, captured_piece)
+        stats.make_unmake_time += perf_counter() - start
+
+        if maximizing:
+            best_evaluation = max(best_evaluation, evaluation)
+            alpha = max(alpha, best_evaluation)
+        else:
+            best_evaluation = min(best_evaluation, evaluation)
+            beta = min(beta, best_evaluation)
+
+        if alpha >= beta:
+            stats.add_cutoff(index)
+            break
+
+    return best_evaluation
+
+
+# alpha-beta search. evaluations are always from white's point of view, white looks for the highest
+# and black for the lowest. alpha is what white is already guaranteed, beta what black is, so once
+# they cross the rest of the moves can't matter. results go into the transposition table with the
+# depth they were searched to and whether they are exact or only a bound.
+def minimax(game: Game, depth: int, alpha: int = -100000, beta: int = 100000, context: SearchContext | None = None, ply: int = 0) -> int:
+    if context is None: context = SearchContext()
+    stats = context.stats
+
+    # endgames we have tables for don't need searching at all
+    if context.tablebase:
+        tablebase_score = context.tablebase.probe(game)
+        if tablebase_score is not None:
+            stats.add_node(ply)
+            stats.tablebase_hits += 1
+            return tablebase_score
+
+    # base case searches captures until things are quiet
+    if depth <= 0:
+        return quiescence(game, alpha, beta, context, ply)
+
+    stats.add_node(ply)
+    context.check_limits()
+
     # check if the position is already in the transposition table
-    if game.zobrist_hash in transposition_table:
-        return transposition_table[game.zobrist_hash]
+    stats.tt_probes += 1
+    tt_move = None
+    entry = transposition_table.get(game.zobrist_hash)
+    if entry:
+        stats.tt_hits += 1
+        entry_depth, entry_evaluation, bound, tt_move = entry
+        if entry_depth >= depth and (bound == BOUND_EXACT
+                                     or (bound == BOUND_LOWER and entry_evaluation >= beta)
+                                     or (bound == BOUND_UPPER and entry_evaluation <= alpha)):
+            stats.tt_cutoffs += 1
+            return entry_evaluation
 
-    # base case evaluates the material on the board, inserts into transposition table
-    if depth <= 0: 
-        board_material = game.evaluate_board_material()
-        transposition_table[game.zobrist_hash] = board_material
-        return board_material
+    original_alpha, original_beta = alpha, beta
+    maximizing = game.side_to_move == PieceColor.White
 
     # start off with the worst possible case
-    best_evaluation = -100000 if game.side_to_move == PieceColor.White else 100000
+    best_evaluation = -100000 if maximizing else 100000
+    best_move = None
 
-    for move in game.get_all_legal_moves():
+    start = perf_counter()
+    moves = order_moves(game, game.get_all_legal_moves(), tt_move)
+    stats.movegen_time += perf_counter() - start
+
+    for index, move in enumerate(moves):
         # first, make the move and save the captured piece for later
+        start = perf_counter()
         captured_piece = game.make_move(move)
+        stats.make_unmake_time += perf_counter() - start
 
-        # now make a recursive call to get the best move for this current game branch
-        best_this_branch = minimax(game, depth - 1)
-
-        # if we find a move with a better rating than what we currently have, replace the current move.
-        # "better rating" is more positive for white, more negative for black. however,
-        # keep in mind the player was flipped earlier when we made the initial move; we take this into account.
-        if game.side_to_move == PieceColor.White and best_this_branch < best_evaluation:
-            best_evaluation = best_this_branch
-        elif game.side_to_move == PieceColor.Black and best_this_branch > best_evaluation:
-            best_evaluation = best_this_branch
+        # now make a recursive call to get the evaluation of this branch
+        evaluation = minimax(game, depth - 1, alpha, beta, context, ply + 1)
 
         # finally, unmake the move using the captured piece from earlier, returning the game to its original state.
+        start = perf_counter()
         game.un_make_move(move, captured_piece)
+        stats.make_unmake_time += perf_counter() - start
+
+        # "better" is more positive for white, more negative for black
+        if maximizing:
+            if evaluation > best_evaluation:
+                best_evaluation, best_move = evaluation, move
+            alpha = max(alpha, best_evaluation)
+        else:
+            if evaluation < best_evaluation:
+                best_evaluation, best_move = evaluation, move
+            beta = min(beta, best_evaluation)
+
+        # the opponent won't let us get here, stop looking
+        if alpha >= beta:
+            stats.add_cutoff(index)
+            break
 
     # update the transposition table for this position
-    transposition_table[game.zobrist_hash] = best_evaluation
+    if best_evaluation <= original_alpha: bound = BOUND_UPPER
+    elif best_evaluation >= original_beta: bound = BOUND_LOWER
+    else: bound = BOUND_EXACT
+    transposition_table[game.zobrist_hash] = (depth, best_evaluation, bound, best_move)
 
     return best_evaluation
 
 
 
-def optimized_engine(game: Game, depth: int):
-    best_move = None
-    best_evaluation = -100000 if game.side_to_move == PieceColor.White else 100000
+# picks the move with the best tablebase result (the fastest win or the slowest loss). moves into
+# positions we have no table for are searched like normal.
+def tablebase_move(game: Game, depth: int, context: SearchContext) -> tuple[Move | None, int]:
+    best_move, best_evaluation = None, None
 
     for move in game.get_all_legal_moves():
-        # first, make the move and save the captured piece for later
         captured_piece = game.make_move(move)
 
-        # now make a recursive call to get the best move for this current game branch
-        evaluation = minimax(game, depth - 1)
+        # the tables also know which of our moves leave the king hanging, skip those
+        if context.tablebase.probe_raw(game) == ILLEGAL:
+            game.un_make_move(move, captured_piece)
+            continue
 
-        # if we find a move with a better rating than what we currently have, replace the current move.
-        # "better rating" is more positive for white, more negative for black. however,
-        # keep in mind the player was flipped earlier when we made the initial move; we take this into account.
-        if game.side_to_move == PieceColor.White and evaluation < best_evaluation:
-            best_move = move
-        elif game.side_to_move == PieceColor.Black and evaluation > best_evaluation:
-            best_move = move
+        evaluation = context.tablebase.probe(game)
+        if evaluation is None:
+            evaluation = minimax(game, depth - 1, context=context, ply=1)
+        game.un_make_move(move, captured_piece)
 
-        # finally, unmake the move using the captured piece from earlier, returning the game to its original state.
+        # the side to move is back to the player making the move here
+        if best_evaluation is None or evaluation * game.side_to_move.value() > best_evaluation * game.side_to_move.value():
+            best_move, best_evaluation = move, evaluation
+
+    return (best_move, best_evaluation)
+
+
+# returns the best move. pass a SearchStats to get the search statistics back (they also end up in
+# last_search_stats), and profile=True to run the search under cProfile. evaluate replaces the plain
+# material count (clear the transposition table when switching between evaluations). with a cache, a
+# root position that was already searched deep enough in an earlier run isn't searched again. only
+# the root goes to the cache, inside the search the transposition table does that job much cheaper
+# than a read from the mmap per node. the cache is only used with the default evaluation, its
+# entries don't say which one made them.
+def optimized_engine(game: Game, depth: int, tablebase: Tablebase | None = None, stats: SearchStats | None = None, profile: bool = False, cache: AnalysisCache | None = None,
+                     evaluate: Callable[[Game], float] | None = None):
+    global last_search_stats
+    context = SearchContext(tablebase=tablebase, stats=stats, evaluate=evaluate)
+    last_search_stats = context.stats
+
+    if evaluate is not None: cache = None
+    context.stats.start(profile)
+
+    if cache:
+        cached = cache.lookup(game, depth, engine="optimized")
+        if cached:
+            context.stats.cache_hits += 1
+            context.stats.stop()
+            return cached[0]
+
+    best_move, best_evaluation = search_root(game, depth, context)
+    context.stats.stop()
+
+    if cache and best_move:
+        cache.store(game, best_move, best_evaluation, depth, engine="optimized")
+
+    return best_move
+
+
+def search_root(game: Game, depth: int, context: SearchContext) -> tuple[Move | None, int]:
+    # probe the tablebases at the root first, they already know the answer
+    if context.tablebase and context.tablebase.probe(game) is not None:
+        return tablebase_move(game, depth, context)
+
+    # the root is searched like any other node, its best move is left in the transposition table
+    best_evaluation = minimax(game, depth, context=context)
+    entry = transposition_table.get(game.zobrist_hash)
+
+    return (entry[3] if entry else None, best_evaluation)
+
+
+# one ranked line of a multi-pv search: the root move, its evaluation, the depth it was searched
+# to and the principal variation (the expected line of play, starting with the move)
+class AnalysisLine:
+    def __init__(self, move: Move, evaluation: int, depth: int, pv: list[Move]):
+        self.move = move
+        self.evaluation = evaluation
+        self.depth = depth
+        self.pv = pv
+
+
+    def __str__(self):
+        return f"{self.evaluation} (depth {self.depth}): {' '.join(str(move) for move in self.pv)}"
+
+
+# follows the best moves stored in the transposition table from the current position
+def principal_variation(game: Game, max_length: int) -> list[Move]:
+    pv = []
+    captured_pieces = []
+    seen = set()
+
+    while len(pv) < max_length and game.zobrist_hash not in seen:
+        seen.add(game.zobrist_hash)
+        entry = transposition_table.get(game.zobrist_hash)
+        if not entry or entry[3] is None: break
+
+        pv.append(entry[3])
+        captured_pieces.append(game.make_move(entry[3]))
+
+    for move, captured_piece in zip(reversed(pv), reversed(captured_pieces)):
         game.un_make_move(move, captured_piece)
 
-    return best_move
\ No newline at end of file
+    return pv
+
+
+# the num_lines best root moves, best first, each with its evaluation and principal variation.
+# this deepens one ply at a time and shares the transposition table (and so the move ordering)
+# across all lines and depths. a root move only gets an exact evaluation if it beats the current
+# num_lines-th best line, everything else is refuted with a cheap bound, so this costs far less
+# than searching num_lines times with moves excluded.
+def multi_pv_engine(game: Game, depth: int, num_lines: int = 3, tablebase: Tablebase | None = None, stats: SearchStats | None = None, profile: bool = False,
+                    evaluate: Callable[[Game], float] | None = None) -> list[AnalysisLine]:
+    global last_search_stats
+    context = SearchContext(tablebase=tablebase, stats=stats, evaluate=evaluate)
+    last_search_stats = context.stats
+    context.stats.start(profile)
+
+    maximizing = game.side_to_move == PieceColor.White
+    root_moves = game.get_all_legal_moves()
+    previous_evaluations = {}
+    lines = []
+
+    for current_depth in range(1, depth + 1):
+        context.stats.add_node(0)
+
+        # try the moves that were best last time first, they set the bar for the rest
+        root_moves.sort(key=lambda move: previous_evaluations.get(move, 0), reverse=maximizing)
+        evaluations = {}
+        lines = []
+
+        for move in root_moves:
+            # the move has to beat our current worst line to make it into the list
+            alpha, beta = -100000, 100000
+            if len(lines) == num_lines:
+                if maximizing: alpha = lines[-1].evaluation
+                else: beta = lines[-1].evaluation
+
+            captured_piece = game.make_move(move)
+            evaluation = minimax(game, current_depth - 1, alpha, beta, context, 1)
+            pv = [move] + principal_variation(game, current_depth - 1) if alpha < evaluation < beta else None
+            game.un_make_move(move, captured_piece)
+
+            evaluations[move] = evaluation
+            if pv is None: continue
+
+            lines.append(AnalysisLine(move, evaluation, current_depth, pv))
+            lines.sort(key=lambda line: line.evaluation, reverse=maximizing)
+            del lines[num_lines:]
+
+        previous_evaluations = evaluations
+
+    context.stats.stop()
+    return lines
+
+
+# searches one ply deeper at a time until it reaches depth, runs out of time (in seconds) or has
+# searched node_limit nodes, and returns the best move, evaluation and depth of the last search that
+# finished. the first ply always finishes, so there is always a move if there is a legal one. a root
+# the tablebases know isn't searched at all, that comes back with depth 0.
+def limited_engine(game: Game, depth: int | None = None, time_limit: float | None = None, node_limit: int | None = None, tablebase: Tablebase | None = None, stats: SearchStats | None = None,
+                   evaluate: Callable[[Game], float] | None = None) -> tuple[Move | None, int, int]:
+    global last_search_stats
+    context = SearchContext(tablebase=tablebase, stats=stats, evaluate=evaluate)
+    last_search_stats = context.stats
+    context.stats.start()
+
+    # an aborted search leaves the board wherever it was, so search a copy
+    search_game = game.copy()
+    best_move, best_evaluation, completed_depth = None, 0, 0
+
+    # the tables already have the exact answer, and iterating would only redo the same lookup
+    if context.tablebase and context.tablebase.probe(search_game) is not None:
+        context.stats.tablebase_hits += 1
+        best_move, best_evaluation = tablebase_move(search_game, 1 if depth is None else max(depth, 1), context)
+        context.stats.stop()
+        return (best_move, best_evaluation, 0)
+
+    for current_depth in range(1, (100 if depth is None else depth) + 1):
+        try:
+            move, evaluation = search_root(search_game, current_depth, context)
+        except SearchAborted:
+            break
+
+        best_move, best_evaluation, completed_depth = move, evaluation, current_depth
+
+        # limits only start counting once we have something to return
+        if time_limit is not None: context.deadline = context.stats.start_time + time_limit
+        if node_limit is not None: context.node_limit = node_limit
+        if (context.deadline is not None and perf_counter() >= context.deadline) or (context.node_limit is not None and context.stats.nodes >= context.node_limit):
+            break
+
+    context.stats.stop()
+    return (best_move, best_evaluation, completed_depth)
@@ -0,0 +1,114 @@
+# pawn structure evaluation (doubled, isolated and passed pawns) with a pawn hash table. pawns move
+# in only a small fraction of moves, so the structure is worked out once per pawn hash (see
+# Game.hash_pawns) and every other position with the same pawns just looks it up.
+#
+#   pawn_table = PawnTable()
+#   optimized_engine.optimized_engine(game, 4, evaluate=pawn_table.evaluate)
+
+
+from game import Game
+from piece import PieceType, PieceColor
+
+
+# bitboards are ints with bit row*8 + col set for square (row, col)
+FILE_MASKS = [sum(1 << (row*8 + col) for row in range(8)) for col in range(8)]
+ADJACENT_FILE_MASKS = [(FILE_MASKS[col-1] if col > 0 else 0) | (FILE_MASKS[col+1] if col < 7 else 0) for col in range(8)]
+
+
+# the squares in front of a pawn on its own and the adjacent files. no enemy pawn there means passed.
+def front_span(color: PieceColor, row: int, col: int) -> int:
+    rows = range(row + 1, 8) if color == PieceColor.White else range(0, row)
+    return sum(1 << (r*8 + c) for r in rows for c in [col-1, col, col+1] if 0 <= c < 8)
+
+PASSED_PAWN_MASKS = {color: [front_span(color, square // 8, square % 8) for square in range(64)] for color in [PieceColor.White, PieceColor.Black]}
+
+# in pawns. the passed pawn bonus goes by how far the pawn has come (ranks from its own side).
+DOUBLED_PAWN_PENALTY = 0.1
+ISOLATED_PAWN_PENALTY = 0.15
+PASSED_PAWN_BONUS = [0.0, 0.05, 0.1, 0.2, 0.35, 0.6, 1.0, 0.0]
+
+
+def pawn_bitboards(game: Game) -> tuple[int, int]:
+    white_pawns, black_pawns = 0, 0
+    for row in range(8):
+        for col in range(8):
+            piece = game.board[row][col]
+            if piece and piece.piece_type == PieceType.Pawn:
+                if piece.piece_color == PieceColor.White: white_pawns |= 1 << (row*8 + col)
+                else: black_pawns |= 1 << (row*8 + col)
+    return (white_pawns, black_pawns)
+
+
+# one side's structure score and its passed pawns (as a bitboard)
+def evaluate_side(color: PieceColor, own_pawns: int, enemy_pawns: int) -> tuple[float, int]:
+    score = 0.0
+    passed = 0
+
+    for col in range(8):
+        on_file = (own_pawns & FILE_MASKS[col]).bit_count()
+        if on_file == 0: continue
+
+        if on_file > 1: score -= DOUBLED_PAWN_PENALTY * (on_file - 1)
+        if not own_pawns & ADJACENT_FILE_MASKS[col]: score -= ISOLATED_PAWN_PENALTY * on_file
+
+    pawns = own_pawns
+    while pawns:
+        square = (pawns & -pawns).bit_length() - 1
+        pawns &= pawns - 1
+
+        if not enemy_pawns & PASSED_PAWN_MASKS[color][square]:
+            passed |= 1 << square
+            rank = square // 8 if color == PieceColor.White else 7 - square // 8
+            score += PASSED_PAWN_BONUS[rank]
+
+    return (score, passed)
+
+
+# the pawn structure score from white's point of view, and each side's passed pawns
+def evaluate_pawn_structure(game: Game) -> tuple[float, int, int]:
+    white_pawns, black_pawns = pawn_bitboards(game)
+    white_score, white_passed = evaluate_side(PieceColor.White, white_pawns, black_pawns)
+    black_score, black_passed = evaluate_side(PieceColor.Black, black_pawns, white_pawns)
+    return (white_score - black_score, white_passed, black_passed)
+
+
+# fixed size table indexed by the pawn hash. a slot keeps the last pawn structure that landed in
+# it, there is no point being clever about replacing since a miss is cheap to redo.
+class PawnTable:
+    def __init__(self, num_entries: int = 1 << 14):
+        self.num_entries = num_entries
+        self.keys = [None] * num_entries
+        self.entries = [None] * num_entries     # (score, white passed pawns, black passed pawns)
+
+        self.hits = 0
+        self.misses = 0
+
+
+    def probe(self, game: Game) -> tuple[float, int, int]:
+        index = game.pawn_hash % self.num_entries
+        if self.keys[index] == game.pawn_hash:
+            self.hits += 1
+            return self.entries[index]
+
+        self.misses += 1
+        entry = evaluate_pawn_structure(game)
+        self.keys[index] = game.pawn_hash
+        self.entries[index] = entry
+        return entry
+
+
+    # material plus pawn structure, an evaluation the engines can use instead of material alone
+    def evaluate(self, game: Game) -> float:
+        return game.evaluate_board_material() + self.probe(game)[0]
+
+
+    def hit_rate(self) -> float:
+        probes = self.hits + self.misses
+        return self.hits / probes if probes else 0.0
+
+
+    def clear(self):
+        self.keys = [None] * self.num_entries
+        self.entries = [None] * self.num_entries
+        self.hits = 0
+        self.misses = 0
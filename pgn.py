@@ -0,0 +1,252 @@
+# streaming pgn reader. games are read one at a time (comments, variations and nags are skipped),
+# their san moves are replayed on a Game and every position comes out with the move played from it
+# and the game's result. nothing is kept once a game is done, so memory stays flat however big the
+# archive is. big files are split at game boundaries and converted on several worker processes.
+#
+#   python pgn.py games/*.pgn --output positions.jsonl
+#   python pgn.py archive.pgn --output positions.bin --format binary --workers 8
+#
+# jsonl records:  {"fen": "...", "move": "e2e4", "san": "e4", "result": 1, "ply": 0}   (result for white)
+# binary output:  positions.bin is packed positions (see Game.to_bytes and position_batch), and
+#                 positions.bin.moves has a RECORD_DTYPE record (polyglot move, result) per position
+
+
+import argparse, json, os, shutil, time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator
+from game import Game
+from move import Move
+from polyglot import encode_move
+from position_batch import load_positions
+
+
+STARTING_FEN = "rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1"
+RESULTS = {"1-0": 1, "0-1": -1, "1/2-1/2": 0, "*": None}     # from white's point of view
+
+RECORD_DTYPE = np.dtype([("move", "<u2"), ("result", "i1")])
+
+
+class PgnGame:
+    def __init__(self, headers: dict[str, str], moves: list[str], result: str):
+        self.headers = headers
+        self.moves = moves          # san
+        self.result = result
+
+
+    def starting_fen(self) -> str:
+        return self.headers.get("FEN", STARTING_FEN)
+
+
+# the games in a stream of pgn lines, one at a time
+def parse_games(lines: Iterator[str]) -> Iterator[PgnGame]:
+    headers, moves = {}, []
+    in_comment, variation_depth = False, 0
+
+    for line in lines:
+        line = line.strip()
+
+        # a tag pair after the movetext means the last game had no result at the end
+        if not in_comment and line.startswith("["):
+            if moves:
+                yield PgnGame(headers, moves, "*")
+                headers, moves = {}, []
+
+            name, _, value = line[1:].rstrip("]").partition(" ")
+            headers[name] = value.strip().strip('"')
+            continue
+
+        if not in_comment and (not line or line.startswith("%")): continue
+
+        i = 0
+        while i < len(line):
+            character = line[i]
+
+            if in_comment:
+                end = line.find("}", i)
+                if end < 0: break
+                in_comment, i = False, end + 1
+                continue
+
+            if character == "{":
+                in_comment = True
+                i += 1
+                continue
+            if character == ";": break
+            if character == "(":
+                variation_depth += 1
+                i += 1
+                continue
+            if character == ")":
+                variation_depth = max(variation_depth - 1, 0)
+                i += 1
+                continue
+            if character.isspace():
+                i += 1
+                continue
+
+            # one token up to the next space or bracket
+            end = i
+            while end < len(line) and not line[end].isspace() and line[end] not in "{}();":
+                end += 1
+            token = line[i:end]
+            i = end
+
+            if variation_depth: continue
+
+            if token in RESULTS:
+                yield PgnGame(headers, moves, token)
+                headers, moves = {}, []
+                continue
+
+            # move numbers ("12." or "12...", sometimes stuck to the move) and nags ("$1")
+            if not token.startswith("0-0"): token = token.lstrip("0123456789").lstrip(".")
+            if not token or token.startswith("$"): continue
+            moves.append(token)
+
+    if moves or headers:
+        yield PgnGame(headers, moves, "*")
+
+
+def read_games(path: str, start: int = 0, end: int | None = None) -> Iterator[PgnGame]:
+    return parse_games(read_lines(path, start, end))
+
+
+# the lines of a file between two byte offsets (which should be game boundaries, see split_file)
+def read_lines(path: str, start: int = 0, end: int | None = None) -> Iterator[str]:
+    with open(path, 'rb') as file:
+        file.seek(start)
+        position = start
+        for line in file:
+            if end is not None and position >= end: break
+            position += len(line)
+            yield line.decode('utf-8', errors='replace')
+
+
+# the positions of a game, each as (position before the move, move, san). the same Game object is
+# played forward and yielded every time, copy it (or pack it) to keep one.
+def replay(pgn_game: PgnGame) -> Iterator[tuple[Game, Move, str]]:
+    game = Game(pgn_game.starting_fen())
+    for san in pgn_game.moves:
+        move = game.move_from_san(san)
+        yield (game, move, san)
+        game.play_move(move)
+
+
+# every position of every game in a file, as (game number, ply, position, move, san, result)
+def iter_positions(path: str, start: int = 0, end: int | None = None, skip_unfinished: bool = True) -> Iterator[tuple[int, int, Game, Move, str, int | None]]:
+    for number, pgn_game in enumerate(read_games(path, start, end)):
+        result = RESULTS.get(pgn_game.result)
+        if skip_unfinished and result is None: continue
+
+        try:
+            for ply, (game, move, san) in enumerate(replay(pgn_game)):
+                yield (number, ply, game, move, san, result)
+        except ValueError:
+            continue    # a broken game stops at its bad move, the positions before it are fine
+
+
+# byte offsets that cut a file into about num_parts pieces, each starting at an "[Event " tag
+def split_file(path: str, num_parts: int) -> list[tuple[int, int]]:
+    size = os.path.getsize(path)
+    boundaries = [0]
+
+    with open(path, 'rb') as file:
+        for part in range(1, num_parts):
+            file.seek(max(part * size // num_parts, boundaries[-1]))
+            file.readline()
+            while True:
+                offset = file.tell()
+                line = file.readline()
+                if not line:
+                    offset = size
+                    break
+                if line.startswith(b"[Event "): break
+            if offset > boundaries[-1]: boundaries.append(offset)
+
+    boundaries.append(size)
+    return [(start, end) for start, end in zip(boundaries, boundaries[1:]) if end > start]
+
+
+# runs in a worker process. converts one piece of a pgn file and returns (games, positions, errors).
+def convert_part(path: str, start: int, end: int, output_path: str, output_format: str) -> tuple[int, int, int]:
+    num_games, num_positions, num_errors = 0, 0, 0
+
+    with open(output_path, 'w' if output_format == "jsonl" else 'wb') as output:
+        moves_output = open(output_path + ".moves", 'wb') if output_format == "binary" else None
+
+        for pgn_game in read_games(path, start, end):
+            result = RESULTS.get(pgn_game.result)
+            if result is None: continue
+            num_games += 1
+
+            # anything that goes wrong with one game (a bad fen header, a move we can't follow) only
+            # costs that game its remaining positions, never the whole part
+            records = []
+            try:
+                for ply, (game, move, san) in enumerate(replay(pgn_game)):
+                    if output_format == "jsonl":
+                        records.append(json.dumps({"fen": game.to_fen(), "move": str(move), "san": san, "result": result, "ply": ply}))
+                    else:
+                        records.append((game.to_bytes(), encode_move(move)))
+            except Exception:
+                num_errors += 1
+
+            if output_format == "jsonl":
+                if records: output.write("\n".join(records) + "\n")
+            else:
+                output.write(b''.join(position for position, _ in records))
+                moves_output.write(np.array([(raw_move, result) for _, raw_move in records], dtype=RECORD_DTYPE).tobytes())
+            num_positions += len(records)
+
+        if moves_output: moves_output.close()
+
+    return (num_games, num_positions, num_errors)
+
+
+# converts every file (in parts, num_workers at a time) and joins the parts into output_path
+def convert(paths: list[str], output_path: str, output_format: str = "jsonl", num_workers: int = os.cpu_count() or 1, part_size: int = 64 << 20) -> tuple[int, int, int]:
+    jobs = []
+    for path in paths:
+        num_parts = max(1, os.path.getsize(path) // part_size + 1)
+        for start, end in split_file(path, num_parts):
+            jobs.append((path, start, end, f"{output_path}.part{len(jobs)}"))
+
+    # the part files go away whether or not the conversion makes it to the end
+    suffixes = [""] + ([".moves"] if output_format == "binary" else [])
+    try:
+        with ProcessPoolExecutor(num_workers) as pool:
+            futures = [pool.submit(convert_part, path, start, end, part_path, output_format) for path, start, end, part_path in jobs]
+            totals = [future.result() for future in futures]
+
+        for suffix in suffixes:
+            with open(output_path + suffix, 'wb') as output:
+                for _, _, _, part_path in jobs:
+                    with open(part_path + suffix, 'rb') as part:
+                        shutil.copyfileobj(part, output)
+    finally:
+        for _, _, _, part_path in jobs:
+            for suffix in suffixes:
+                if os.path.exists(part_path + suffix): os.remove(part_path + suffix)
+
+    return tuple(sum(total[i] for total in totals) for i in range(3))
+
+
+# the binary output as (packed positions, records), both memory mapped
+def load_records(path: str) -> tuple[np.ndarray, np.ndarray]:
+    return (load_positions(path), np.memmap(path + ".moves", dtype=RECORD_DTYPE, mode='r'))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="turn pgn files into training positions")
+    parser.add_argument("paths", nargs="+")
+    parser.add_argument("--output", default="positions.jsonl")
+    parser.add_argument("--format", choices=["jsonl", "binary"], default="jsonl")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    num_games, num_positions, num_errors = convert(args.paths, args.output, args.format, args.workers)
+    elapsed = time.perf_counter() - start
+
+    print(f"{num_games} games, {num_positions} positions ({num_errors} games cut short by a move or header we couldn't read) in {round(elapsed, 2)}s, {int(num_positions / elapsed) if elapsed else 0} positions/s")
@@ -50,12 +50,36 @@ class PieceType(Enum):
 
 
 
+# zobrist index of every piece, see Piece.zobrist_index
+ZOBRIST_INDICES = {
+    (PieceType.Pawn, PieceColor.White): 0,
+    (PieceType.Rook, PieceColor.White): 1,
+    (PieceType.Knight, PieceColor.White): 2,
+    (PieceType.Bishop, PieceColor.White): 3,
+    (PieceType.Queen, PieceColor.White): 4,
+    (PieceType.King, PieceColor.White): 5,
+
+    (PieceType.Pawn, PieceColor.Black): 6,
+    (PieceType.Rook, PieceColor.Black): 7,
+    (PieceType.Knight, PieceColor.Black): 8,
+    (PieceType.Bishop, PieceColor.Black): 9,
+    (PieceType.Queen, PieceColor.Black): 10,
+    (PieceType.King, PieceColor.Black): 11
+}
+
+# fen letter of every piece, in zobrist index order
+FEN_CHARACTERS = "PRNBQKprnbqk"
+
+
 # our piece only needs to know its type and color
 class Piece:
     def __init__(self, piece_type: PieceType, piece_color: PieceColor):
         self.piece_type = piece_type
         self.piece_color = piece_color
 
+        # pieces never change, so look this up once instead of on every hash update
+        self._zobrist_index = ZOBRIST_INDICES.get((piece_type, piece_color))
+
 
     # black pieces have negative value
     def get_value(self):
@@ -94,22 +118,7 @@ class Piece:
 
     # return's a piece's zobrist index for use in hashing
     def zobrist_index(self) -> int:
-        indices = {
-            (PieceType.Pawn, PieceColor.White): 0,
-            (PieceType.Rook, PieceColor.White): 1,
-            (PieceType.Knight, PieceColor.White): 2,
-            (PieceType.Bishop, PieceColor.White): 3,
-            (PieceType.Queen, PieceColor.White): 4,
-            (PieceType.King, PieceColor.White): 5,
-
-            (PieceType.Pawn, PieceColor.Black): 6,
-            (PieceType.Rook, PieceColor.Black): 7,
-            (PieceType.Knight, PieceColor.Black): 8,
-            (PieceType.Bishop, PieceColor.Black): 9,
-            (PieceType.Queen, PieceColor.Black): 10,
-            (PieceType.King, PieceColor.Black): 11
-        }
-        return indices.get((self.piece_type, self.piece_color))
+        return self._zobrist_index
 
 
     # for reading FEN
@@ -140,22 +149,8 @@ class Piece:
 
     # for printing FEN
     def to_character(self) -> str:
-        piece_to_char = {
-            (PieceType.Pawn, PieceColor.White): 'P',
-            (PieceType.Rook, PieceColor.White): 'R',
-            (PieceType.Knight, PieceColor.White): 'N',
-            (PieceType.Bishop, PieceColor.White): 'B',
-            (PieceType.Queen, PieceColor.White): 'Q',
-            (PieceType.King, PieceColor.White): 'K',
-            (PieceType.Pawn, PieceColor.Black): 'p',
-            (PieceType.Rook, PieceColor.Black): 'r',
-            (PieceType.Knight, PieceColor.Black): 'n',
-            (PieceType.Bishop, PieceColor.Black): 'b',
-            (PieceType.Queen, PieceColor.Black): 'q',
-            (PieceType.King, PieceColor.Black): 'k'
-        }
-
-        return piece_to_char.get((self.piece_type, self.piece_color), '?')
+        if self._zobrist_index is None: return '?'
+        return FEN_CHARACTERS[self._zobrist_index]
 
 
     # returns true if matches both color and type
@@ -1,24 +1,36 @@
 # play the engine
 
 
+import os
 from piece import *
 from move import Move
 from game import Game
 from engine import *
+from polyglot import OpeningBook
 
 
-def play_engine_from_start(depth=4):
+# if there's a polyglot book at book_path, the engine checks it before every search and only
+# starts thinking once it's out of book. moves go through play_move so castling rights and the en
+# passant square (and with them the book key) follow the game.
+def play_engine_from_start(depth=4, book_path: str | None = "book.bin"):
     g = Game()
+    book = OpeningBook(book_path) if book_path and os.path.exists(book_path) else None
 
     while True:
         print(g)
         move_input = Move.from_uci(input("Enter a move in uci format (e.g. e2e4): "))
-        g.make_move(move=move_input)
+        g.play_move(move_input)
 
         print(g)
+        book_move = book.get_move(g) if book else None
+        if book_move:
+            g.play_move(book_move)
+            print("Engine played book move", book_move)
+            continue
+
         print("Calculating engine move...")
         engine_move, engine_eval = brute_force_best_move(game=g, depth=depth)
-        g.make_move(engine_move)
+        g.play_move(engine_move)
         print("Engine evaluation is", engine_eval)
 
 play_engine_from_start(3)
\ No newline at end of file
@@ -0,0 +1,59 @@
+# batches of packed positions (see Game.to_bytes) as numpy arrays, one 32 byte row per position.
+# these can be handed to worker processes, written to disk or memory mapped as they are.
+
+
+import numpy as np
+from game import Game, PACKED_STRUCT
+
+
+POSITION_SIZE = PACKED_STRUCT.size
+
+
+def encode_positions(games: list[Game]) -> np.ndarray:
+    return np.frombuffer(b''.join(game.to_bytes() for game in games), dtype=np.uint8).reshape(-1, POSITION_SIZE)
+
+
+def decode_positions(positions: np.ndarray) -> list[Game]:
+    data = np.ascontiguousarray(positions, dtype=np.uint8).tobytes()
+    return [Game.from_bytes(data[i:i+POSITION_SIZE]) for i in range(0, len(data), POSITION_SIZE)]
+
+
+# a few fields can be read for the whole batch at once without decoding anything
+def occupancies(positions: np.ndarray) -> np.ndarray:
+    return np.ascontiguousarray(positions[:, :8]).view('<u8').reshape(-1)
+
+
+def piece_counts(positions: np.ndarray) -> np.ndarray:
+    bits = np.unpackbits(np.ascontiguousarray(positions[:, :8]), axis=1)
+    return bits.sum(axis=1)
+
+
+def white_to_move(positions: np.ndarray) -> np.ndarray:
+    return (positions[:, 24] & 1) == 0
+
+
+# the whole board of every position at once: (positions, 64) with the piece's zobrist index + 1 on
+# each square (a1 = 0, h8 = 63) and 0 where it's empty. pieces are packed in square order, so the
+# k-th occupied square holds the k-th nibble.
+def piece_squares(positions: np.ndarray) -> np.ndarray:
+    positions = np.ascontiguousarray(positions, dtype=np.uint8)
+    occupied = np.unpackbits(positions[:, :8], axis=1, bitorder='little').astype(bool)
+
+    packed = positions[:, 8:24]
+    nibbles = np.empty((len(positions), 32), dtype=np.uint8)
+    nibbles[:, 0::2] = packed & 15
+    nibbles[:, 1::2] = packed >> 4
+
+    slots = np.minimum(np.cumsum(occupied, axis=1) - 1, 31)
+    return np.where(occupied, np.take_along_axis(nibbles, slots, axis=1), 0).astype(np.uint8)
+
+
+# reads or writes a whole file of packed positions
+def save_positions(path: str, positions: np.ndarray):
+    np.ascontiguousarray(positions, dtype=np.uint8).tofile(path)
+
+
+def load_positions(path: str, mmap: bool = True) -> np.ndarray:
+    if mmap:
+        return np.memmap(path, dtype=np.uint8, mode='r').reshape(-1, POSITION_SIZE)
+    return np.fromfile(path, dtype=np.uint8).reshape(-1, POSITION_SIZE)
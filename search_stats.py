@@ -0,0 +1,114 @@
+# statistics about a single search: how many nodes, how the transposition table did, how early
+# cutoffs happen and where the time went. every search fills one of these in.
+
+
+import cProfile, io, pstats, time
+
+
+class SearchStats:
+    def __init__(self):
+        self.nodes = 0                  # every position the search visits, quiescence included
+        self.quiescence_nodes = 0
+        self.nodes_per_ply = []         # nodes_per_ply[p] is the number of nodes p plies from the root
+
+        self.tt_probes = 0
+        self.tt_hits = 0
+        self.tt_cutoffs = 0             # hits that let us return without searching
+        self.tablebase_hits = 0
+        self.cache_hits = 0             # searches answered by the analysis cache at the root
+
+        # cutoff_move_index[i] counts beta cutoffs caused by the i-th move searched. with good
+        # move ordering almost everything lands on 0.
+        self.cutoff_move_index = {}
+
+        # seconds spent in each part of the hot path
+        self.movegen_time = 0.0
+        self.eval_time = 0.0
+        self.make_unmake_time = 0.0
+
+        self.start_time = 0.0
+        self.end_time = 0.0
+
+        self.profiler = None
+        self.profile = None             # pstats.Stats after a profiled search
+
+
+    # call at the start and end of a search. with profile=True the whole search runs under cProfile.
+    def start(self, profile: bool = False):
+        self.start_time = time.perf_counter()
+        if profile:
+            self.profiler = cProfile.Profile()
+            self.profiler.enable()
+
+
+    def stop(self):
+        if self.profiler:
+            self.profiler.disable()
+            self.profile = pstats.Stats(self.profiler, stream=io.StringIO())
+            self.profiler = None
+        self.end_time = time.perf_counter()
+
+
+    # counts a node p plies from the root
+    def add_node(self, ply: int, quiescence: bool = False):
+        self.nodes += 1
+        if quiescence: self.quiescence_nodes += 1
+
+        while len(self.nodes_per_ply) <= ply:
+            self.nodes_per_ply.append(0)
+        self.nodes_per_ply[ply] += 1
+
+
+    def add_cutoff(self, move_index: int):
+        self.cutoff_move_index[move_index] = self.cutoff_move_index.get(move_index, 0) + 1
+
+
+    def elapsed(self) -> float:
+        return (self.end_time or time.perf_counter()) - self.start_time
+
+
+    def nodes_per_second(self) -> float:
+        elapsed = self.elapsed()
+        return self.nodes / elapsed if elapsed > 0 else 0.0
+
+
+    # ratio of nodes at each ply to the ply before it
+    def effective_branching_factors(self) -> list[float]:
+        return [self.nodes_per_ply[p] / self.nodes_per_ply[p-1] for p in range(1, len(self.nodes_per_ply)) if self.nodes_per_ply[p-1]]
+
+
+    def to_dict(self) -> dict:
+        return {
+            "nodes": self.nodes,
+            "quiescence_nodes": self.quiescence_nodes,
+            "nodes_per_ply": self.nodes_per_ply,
+            "nodes_per_second": self.nodes_per_second(),
+            "effective_branching_factors": self.effective_branching_factors(),
+            "tt_probes": self.tt_probes,
+            "tt_hits": self.tt_hits,
+            "tt_cutoffs": self.tt_cutoffs,
+            "tablebase_hits": self.tablebase_hits,
+            "cache_hits": self.cache_hits,
+            "cutoff_move_index": {str(index): count for index, count in sorted(self.cutoff_move_index.items())},
+            "movegen_time": self.movegen_time,
+            "eval_time": self.eval_time,
+            "make_unmake_time": self.make_unmake_time,
+            "elapsed": self.elapsed()
+        }
+
+
+    # the top functions of a profiled search, sorted by cumulative time
+    def profile_report(self, limit: int = 20) -> str:
+        if not self.profile: return ""
+        self.profile.stream = io.StringIO()
+        self.profile.sort_stats('cumulative').print_stats(limit)
+        return self.profile.stream.getvalue()
+
+
+    def __str__(self) -> str:
+        s = f"{self.nodes} nodes ({self.quiescence_nodes} quiescence) in {round(self.elapsed(), 2)}s, {int(self.nodes_per_second())} nodes/s\n"
+        s += f"TT: {self.tt_probes} probes, {self.tt_hits} hits, {self.tt_cutoffs} cutoffs. tablebase hits: {self.tablebase_hits}, cache hits: {self.cache_hits}\n"
+        s += f"EBF per ply: {[round(factor, 2) for factor in self.effective_branching_factors()]}\n"
+        s += f"cutoffs by move index: {dict(sorted(self.cutoff_move_index.items()))}\n"
+        s += f"time in movegen {round(self.movegen_time, 2)}s, eval {round(self.eval_time, 2)}s, make/unmake {round(self.make_unmake_time, 2)}s"
+        return s
@@ -0,0 +1,254 @@
+# local analysis server. clients send one json request per line over tcp and get one json reply per
+# line back. jobs are queued and run on a pool of engine worker processes that stay alive (and keep
+# their transposition tables warm, up to a size) between jobs. identical requests that are already running are
+# only searched once, and finished results are cached by position.
+#
+#   python server.py --port 8765 --workers 4
+#
+# requests:  {"fen": "...", "depth": 6, "time": 2.0, "nodes": 100000}   (any of the limits)
+#            {"command": "stats"}
+
+
+import argparse, asyncio, json, math, os, socket, time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from game import Game
+from polyglot import polyglot_key
+from tablebase import Tablebase
+import optimized_engine
+
+
+# each worker process opens the tablebases once and keeps them
+worker_tablebase = None
+
+# the transposition table is kept between jobs until it has this many entries (a few hundred bytes
+# each), then it starts over. without a limit a long lived worker only ever grows.
+worker_tt_entries = 1 << 18
+
+
+def init_worker(tablebase_directory: str | None, tt_entries: int = 1 << 18):
+    global worker_tablebase, worker_tt_entries
+    if tablebase_directory and os.path.isdir(tablebase_directory):
+        worker_tablebase = Tablebase(tablebase_directory)
+    worker_tt_entries = tt_entries
+
+
+# runs in a worker process
+def analyse(fen: str, depth: int | None, time_limit: float | None, node_limit: int | None) -> dict:
+    if len(optimized_engine.transposition_table) > worker_tt_entries:
+        optimized_engine.transposition_table.clear()
+
+    move, evaluation, completed_depth = optimized_engine.limited_engine(Game(fen), depth, time_limit, node_limit, tablebase=worker_tablebase)
+    stats = optimized_engine.last_search_stats
+
+    return {
+        "move": str(move) if move else None,
+        "evaluation": evaluation,
+        "depth": completed_depth,
+        "tablebase": completed_depth == 0 and move is not None,     # answered by the tablebases, not searched
+        "nodes": stats.nodes,
+        "search_time": stats.elapsed()
+    }
+
+
+# what each limit has to be, a bad one would otherwise leave a worker searching with no limit at all
+LIMIT_TYPES = {"depth": (int,), "time": (int, float), "nodes": (int,)}
+
+
+def check_limits(request: dict) -> str | None:
+    for name, types in LIMIT_TYPES.items():
+        value = request.get(name)
+        if value is None: continue
+        if isinstance(value, bool) or not isinstance(value, types) or not (0 < value < math.inf):
+            return f"{name} must be a positive {'number' if float in types else 'integer'}"
+    return None
+
+
+def percentile(values: list[float], fraction: float) -> float | None:
+    if not values: return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class AnalysisServer:
+    def __init__(self, num_workers: int = os.cpu_count() or 1, cache_size: int = 100000, tablebase_directory: str | None = "tablebases", tt_entries: int = 1 << 18):
+        self.num_workers = num_workers
+        self.pool = ProcessPoolExecutor(num_workers, initializer=init_worker, initargs=(tablebase_directory, tt_entries))
+
+        self.queue = None               # made once the event loop is running
+        self.in_flight = {}             # request key -> future for requests being searched right now
+        self.cache = OrderedDict()      # request key -> result, least recently used first
+        self.cache_size = cache_size
+
+        self.latencies = deque(maxlen=10000)
+        self.num_requests = 0
+        self.num_cache_hits = 0
+        self.num_deduplicated = 0
+
+
+    # the same position with the same limits is the same job
+    @staticmethod
+    def request_key(game: Game, request: dict) -> tuple:
+        return (polyglot_key(game), request.get("depth"), request.get("time"), request.get("nodes"))
+
+
+    async def submit(self, request: dict) -> dict:
+        game = Game(request["fen"])
+        key = self.request_key(game, request)
+
+        if key in self.cache:
+            self.cache.move_to_end(key)
+            self.num_cache_hits += 1
+            return dict(self.cache[key], cached=True)
+
+        if key in self.in_flight:
+            self.num_deduplicated += 1
+            return dict(await asyncio.shield(self.in_flight[key]), cached=False)
+
+        future = asyncio.get_running_loop().create_future()
+        self.in_flight[key] = future
+        await self.queue.put((key, request, future))
+
+        try:
+            result = await asyncio.shield(future)
+        finally:
+            self.in_flight.pop(key, None)
+
+        self.cache[key] = result
+        if len(self.cache) > self.cache_size:
+            self.cache.popitem(last=False)
+
+        return dict(result, cached=False)
+
+
+    # one of these per worker process, so a job only leaves the queue when a worker is free
+    async def dispatch(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            key, request, future = await self.queue.get()
+            try:
+                limits = (request.get("depth"), request.get("time"), request.get("nodes"))
+                if not any(limit is not None for limit in limits): limits = (4, None, None)
+                result = await loop.run_in_executor(self.pool, analyse, request["fen"], *limits)
+                future.set_result(result)
+            except Exception as exception:
+                future.set_exception(exception)
+            finally:
+                self.queue.task_done()
+
+
+    def stats(self) -> dict:
+        latencies = list(self.latencies)
+        return {
+            "queue_depth": self.queue.qsize(),
+            "in_flight": len(self.in_flight),
+            "workers": self.num_workers,
+            "requests": self.num_requests,
+            "cache_hits": self.num_cache_hits,
+            "deduplicated": self.num_deduplicated,
+            "cache_size": len(self.cache),
+            "latency_p50": percentile(latencies, 0.50),
+            "latency_p90": percentile(latencies, 0.90),
+            "latency_p99": percentile(latencies, 0.99)
+        }
+
+
+    async def handle_request(self, request: dict) -> dict:
+        if request.get("command") == "stats":
+            return self.stats()
+
+        if "fen" not in request:
+            return {"error": "request needs a fen"}
+
+        error = check_limits(request)
+        if error:
+            return {"fen": request["fen"], "error": error}
+
+        start = time.perf_counter()
+        self.num_requests += 1
+        try:
+            result = await self.submit(request)
+        except Exception as exception:
+            return {"fen": request["fen"], "error": str(exception)}
+
+        latency = time.perf_counter() - start
+        self.latencies.append(latency)
+        return dict(result, fen=request["fen"], latency=latency)
+
+
+    # every line is its own request, so one client can have many running at once. replies carry
+    # the request's "id" (if it had one) since they can come back in a different order.
+    async def handle_client(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        lock = asyncio.Lock()
+        tasks = set()
+
+        # every line gets exactly one reply, whatever is in it
+        async def respond(line: bytes):
+            try:
+                request = json.loads(line)
+            except ValueError:     # bad json or not even utf-8
+                reply = {"error": "invalid json"}
+            else:
+                if not isinstance(request, dict):
+                    reply = {"error": "request must be a json object"}
+                else:
+                    try:
+                        reply = await self.handle_request(request)
+                    except Exception as exception:
+                        reply = {"error": str(exception) or type(exception).__name__}
+                    if "id" in request: reply["id"] = request["id"]
+
+            async with lock:
+                writer.write(json.dumps(reply).encode() + b"\n")
+                await writer.drain()
+
+        try:
+            while line := await reader.readline():
+                if line.strip():
+                    task = asyncio.create_task(respond(line))
+                    tasks.add(task)
+                    task.add_done_callback(tasks.discard)
+            if tasks: await asyncio.gather(*tasks)
+        except ConnectionError:
+            pass
+        finally:
+            writer.close()
+
+
+    async def serve(self, host: str = "127.0.0.1", port: int = 8765):
+        self.queue = asyncio.Queue()
+        dispatchers = [asyncio.create_task(self.dispatch()) for _ in range(self.num_workers)]
+
+        server = await asyncio.start_server(self.handle_client, host, port)
+        print(f"Analysis server listening on {host}:{port} with {self.num_workers} workers", flush=True)
+        try:
+            async with server:
+                await server.serve_forever()
+        finally:
+            for dispatcher in dispatchers: dispatcher.cancel()
+            self.pool.shutdown(cancel_futures=True)
+
+
+# a tiny blocking client for scripts: sends one request and waits for the reply
+def request_analysis(request: dict, host: str = "127.0.0.1", port: int = 8765) -> dict:
+    with socket.create_connection((host, port)) as connection:
+        connection.sendall(json.dumps(request).encode() + b"\n")
+        with connection.makefile('rb') as reply:
+            return json.loads(reply.readline())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="local analysis server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--cache-size", type=int, default=100000)
+    parser.add_argument("--tablebases", default="tablebases")
+    parser.add_argument("--tt-entries", type=int, default=1 << 18, help="transposition table entries a worker keeps between jobs")
+    args = parser.parse_args()
+
+    server = AnalysisServer(args.workers, args.cache_size, args.tablebases, args.tt_entries)
+    try:
+        asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
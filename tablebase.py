@@ -0,0 +1,422 @@
+# endgame tablebases. small endings (KQK, KRK, KPK, ...) are solved offline by retrograde analysis
+# and stored as one byte per position, so the search can look the answer up instead of searching.
+#
+# generate them with:  python tablebase.py [directory] [signatures...]
+# e.g.                 python tablebase.py tablebases KQK KRK KPK
+
+
+import mmap, os, sys
+from array import array
+from piece import *
+from game import Game
+
+
+# each table file is a 16 byte header followed by one byte per position index
+HEADER_SIZE = 16
+MAGIC = b'TBL1'
+
+# byte values. wins are stored as the (odd) number of plies to mate, losses as the (even) number
+# of plies until we get mated plus two, so 2 means we are checkmated right now.
+DRAW = 0
+ILLEGAL = 255
+
+# a tablebase win is worth less than taking the king (10000) but more than any material
+TB_WIN_SCORE = 1000
+
+# canonical order of the pieces inside a signature and an index
+PIECE_ORDER = 'KQRBNP'
+PIECE_CHARACTERS = {
+    PieceType.King: 'K',
+    PieceType.Queen: 'Q',
+    PieceType.Rook: 'R',
+    PieceType.Bishop: 'B',
+    PieceType.Knight: 'N',
+    PieceType.Pawn: 'P'
+}
+
+
+# squares are row*8 + col everywhere in here, the same rows and columns as Game.board
+def _targets(offsets: list[tuple[int, int]]) -> list[list[int]]:
+    targets = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        targets.append([(row+dr)*8 + col+dc for dr, dc in offsets if 0 <= row+dr < 8 and 0 <= col+dc < 8])
+    return targets
+
+KNIGHT_TARGETS = _targets([(2,1), (1,2), (-1,2), (-2,1), (-2,-1), (-1,-2), (1,-2), (2,-1)])
+KING_TARGETS = _targets([(-1, -1), (-1, 1), (1, -1), (1, 1), (-1, 0), (0, -1), (1, 0), (0, 1)])
+
+DIAGONALS = [(-1, -1), (-1, 1), (1, -1), (1, 1)]
+ORTHOGONALS = [(-1, 0), (0, -1), (1, 0), (0, 1)]
+
+# rays[square][direction] is the list of squares walking out from square in that direction
+def _rays(directions: list[tuple[int, int]]) -> list[list[list[int]]]:
+    rays = []
+    for square in range(64):
+        row, col = divmod(square, 8)
+        square_rays = []
+        for dr, dc in directions:
+            ray, r, c = [], row+dr, col+dc
+            while 0 <= r < 8 and 0 <= c < 8:
+                ray.append(r*8 + c)
+                r, c = r+dr, c+dc
+            square_rays.append(ray)
+        rays.append(square_rays)
+    return rays
+
+DIAGONAL_RAYS = _rays(DIAGONALS)
+ORTHOGONAL_RAYS = _rays(ORTHOGONALS)
+
+
+# splits "KQK" into (['K', 'Q'], ['K']). the first king starts white's pieces, the second black's.
+def split_signature(signature: str) -> tuple[list[str], list[str]]:
+    second_king = signature.index('K', 1)
+    return list(signature[:second_king]), list(signature[second_king:])
+
+
+# true if neither side can ever checkmate, so every legal position is a draw
+def is_insufficient_material(signature: str) -> bool:
+    white, black = split_signature(signature)
+    return all(len(side) == 1 or (len(side) == 2 and side[1] in 'BN') for side in (white, black))
+
+
+# pieces are (character, is_white, square) tuples. sorts them into signature order and mirrors the
+# board if needed so that white is always the side with material. returns the signature, the sorted
+# pieces and whether white is to move in the (possibly mirrored) position.
+def canonicalize(pieces: list[tuple[str, bool, int]], white_to_move: bool) -> tuple[str, list[tuple[str, bool, int]], bool]:
+    white_material = sum(1 for piece in pieces if piece[1] and piece[0] != 'K')
+    black_material = sum(1 for piece in pieces if not piece[1] and piece[0] != 'K')
+
+    if black_material > white_material:
+        pieces = [(character, not is_white, square ^ 56) for character, is_white, square in pieces]
+        white_to_move = not white_to_move
+
+    pieces = sorted(pieces, key=lambda piece: (not piece[1], PIECE_ORDER.index(piece[0]), piece[2]))
+    signature = ''.join(piece[0] for piece in pieces)
+
+    return signature, pieces, white_to_move
+
+
+# position index: side to move, then every piece's square as a base 64 digit in signature order
+def position_index(pieces: list[tuple[str, bool, int]], white_to_move: bool) -> int:
+    index = 0 if white_to_move else 1
+    for piece in pieces:
+        index = index * 64 + piece[2]
+    return index
+
+
+def _is_attacked(square: int, by_white: bool, pieces: list[tuple[str, bool, int]], occupied: set[int]) -> bool:
+    for character, is_white, piece_square in pieces:
+        if is_white != by_white: continue
+
+        if character == 'K':
+            if square in KING_TARGETS[piece_square]: return True
+        elif character == 'N':
+            if square in KNIGHT_TARGETS[piece_square]: return True
+        elif character == 'P':
+            row, col = divmod(piece_square, 8)
+            attack_row = row + (1 if is_white else -1)
+            if square // 8 == attack_row and abs(square % 8 - col) == 1: return True
+        else:
+            ray_sets = []
+            if character in 'QB': ray_sets.append(DIAGONAL_RAYS[piece_square])
+            if character in 'QR': ray_sets.append(ORTHOGONAL_RAYS[piece_square])
+            for rays in ray_sets:
+                for ray in rays:
+                    for target in ray:
+                        if target == square: return True
+                        if target in occupied: break
+
+    return False
+
+
+# true if the side that is NOT to move is in check, which can't happen in a real game
+def _is_illegal(pieces: list[tuple[str, bool, int]], white_to_move: bool) -> bool:
+    occupied = {piece[2] for piece in pieces}
+    if len(occupied) != len(pieces): return True
+
+    for character, is_white, square in pieces:
+        if character == 'P' and square // 8 in (0, 7): return True
+
+    king_square = next(square for character, is_white, square in pieces if character == 'K' and is_white != white_to_move)
+    return _is_attacked(king_square, white_to_move, pieces, occupied)
+
+
+# all legal moves as the resulting piece lists (the side to move flips afterwards)
+def _legal_children(pieces: list[tuple[str, bool, int]], white_to_move: bool) -> list[list[tuple[str, bool, int]]]:
+    by_square = {piece[2]: index for index, piece in enumerate(pieces)}
+    children = []
+
+    def add(index: int, target: int, promotion: str | None = None):
+        character, is_white, _ = pieces[index]
+        child = [piece for i, piece in enumerate(pieces) if i != index and piece[2] != target]
+        child.append((promotion or character, is_white, target))
+
+        king_square = next(square for c, w, square in child if c == 'K' and w == white_to_move)
+        if not _is_attacked(king_square, not white_to_move, child, {piece[2] for piece in child}):
+            children.append(child)
+
+    # we can move to empty squares and take anything but the king
+    def can_land(target: int) -> bool:
+        if target not in by_square: return True
+        other = pieces[by_square[target]]
+        return other[1] != white_to_move and other[0] != 'K'
+
+    for index, (character, is_white, square) in enumerate(pieces):
+        if is_white != white_to_move: continue
+
+        if character == 'P':
+            row, col = divmod(square, 8)
+            step = 1 if is_white else -1
+            last_row = 7 if is_white else 0
+            promotions = ['Q', 'R', 'B', 'N'] if row + step == last_row else [None]
+
+            forward = square + 8*step
+            if forward not in by_square:
+                for promotion in promotions: add(index, forward, promotion)
+                start_row = 1 if is_white else 6
+                if row == start_row and forward + 8*step not in by_square:
+                    add(index, forward + 8*step)
+
+            for dc in (-1, 1):
+                if 0 <= col + dc < 8:
+                    target = forward + dc
+                    if target in by_square and can_land(target):
+                        for promotion in promotions: add(index, target, promotion)
+
+        elif character in 'KN':
+            for target in (KING_TARGETS if character == 'K' else KNIGHT_TARGETS)[square]:
+                if can_land(target): add(index, target)
+
+        else:
+            ray_sets = []
+            if character in 'QB': ray_sets.append(DIAGONAL_RAYS[square])
+            if character in 'QR': ray_sets.append(ORTHOGONAL_RAYS[square])
+            for rays in ray_sets:
+                for ray in rays:
+                    for target in ray:
+                        if can_land(target): add(index, target)
+                        if target in by_square: break
+
+    return children
+
+
+# generates the table for a signature, recursively generating (or loading) the tables it converts
+# into by captures and promotions. returns the raw table bytes, one per position index.
+def generate(signature: str, directory: str, tables: dict[str, bytes] | None = None, verbose: bool = True) -> bytes:
+    if tables is None: tables = {}
+    if signature in tables: return tables[signature]
+
+    path = os.path.join(directory, signature + '.tb')
+    if os.path.exists(path):
+        with open(path, 'rb') as file:
+            tables[signature] = file.read()[HEADER_SIZE:]
+        return tables[signature]
+
+    white, black = split_signature(signature)
+    characters = white + black
+    colors = [True] * len(white) + [False] * len(black)
+    num_pieces = len(characters)
+    half = 64 ** num_pieces
+    size = 2 * half
+
+    if verbose: print("Generating", signature, "...", flush=True)
+
+    table = bytearray(size)
+    insufficient = is_insufficient_material(signature)
+
+    # value of a child position that lives in some other table, from its side to move's view
+    def external_value(child_signature: str, child_pieces: list[tuple[str, bool, int]], child_white_to_move: bool) -> int:
+        if is_insufficient_material(child_signature): return DRAW
+        child_table = generate(child_signature, directory, tables, verbose)
+        return child_table[position_index(child_pieces, child_white_to_move)]
+
+    # first pass: find every legal position's children. children inside this table are stored as
+    # a flat successor list, children in other tables are resolved right away.
+    successors = array('i')
+    first_successor = array('i', [0]) * (size + 1)
+    counters = array('i', [0]) * size
+    escapes = bytearray(size)           # has a move into another table that doesn't lose
+    external_losses = bytearray(size)   # longest loss through a move into another table
+    buckets: dict[int, list[tuple[int, bool]]] = {}
+
+    def schedule(distance: int, index: int, is_win: bool):
+        buckets.setdefault(distance, []).append((index, is_win))
+
+    for index in range(size):
+        first_successor[index] = len(successors)
+
+        remainder, squares = index % half, []
+        for _ in range(num_pieces):
+            remainder, square = divmod(remainder, 64)
+            squares.append(square)
+        squares.reverse()
+
+        white_to_move = index < half
+        pieces = list(zip(characters, colors, squares))
+
+        if _is_illegal(pieces, white_to_move):
+            table[index] = ILLEGAL
+            continue
+        if insufficient: continue
+
+        children = _legal_children(pieces, white_to_move)
+        if not children:
+            king_square = next(square for c, w, square in pieces if c == 'K' and w == white_to_move)
+            if _is_attacked(king_square, not white_to_move, pieces, set(squares)):
+                schedule(0, index, False) # checkmated
+            continue # otherwise stalemate, which stays a draw
+
+        for child in children:
+            child_signature, child_pieces, child_white_to_move = canonicalize(child, not white_to_move)
+            if child_signature == signature:
+                successors.append(position_index(child_pieces, child_white_to_move))
+                counters[index] += 1
+                continue
+
+            value = external_value(child_signature, child_pieces, child_white_to_move)
+            if value == DRAW or value % 2 == 0:
+                escapes[index] = 1
+                if value != DRAW: schedule(value - 2 + 1, index, True)
+            else:
+                external_losses[index] = max(external_losses[index], value + 1)
+
+        # every move leaves this table and none of them holds
+        if counters[index] == 0 and not escapes[index]:
+            schedule(external_losses[index], index, False)
+
+    first_successor[size] = len(successors)
+
+    # invert the successor lists so we can walk backwards from solved positions
+    first_predecessor = array('i', [0]) * (size + 1)
+    for child in successors:
+        first_predecessor[child + 1] += 1
+    for index in range(size):
+        first_predecessor[index + 1] += first_predecessor[index]
+
+    predecessors = array('i', [0]) * len(successors)
+    fill = array('i', first_predecessor)
+    for index in range(size):
+        for position in range(first_successor[index], first_successor[index + 1]):
+            child = successors[position]
+            predecessors[fill[child]] = index
+            fill[child] += 1
+
+    # retrograde pass. positions are solved in order of distance to mate, so the first time we
+    # reach a win it is the fastest one, and a loss is only scheduled once its last move is known
+    # to lose (which is then also its longest one).
+    solved = bytearray(size)
+    distance = 0
+    while buckets:
+        for index, is_win in buckets.pop(distance, []):
+            if solved[index]: continue
+            solved[index] = 1
+
+            if distance > 253: raise ValueError(f"Distance to mate too long to store in {signature}")
+            table[index] = distance if is_win else distance + 2
+
+            for position in range(first_predecessor[index], first_predecessor[index + 1]):
+                parent = predecessors[position]
+                if solved[parent]: continue
+
+                if not is_win:
+                    schedule(distance + 1, parent, True)
+                else:
+                    counters[parent] -= 1
+                    if counters[parent] == 0 and not escapes[parent]:
+                        schedule(max(distance + 1, external_losses[parent]), parent, False)
+
+        distance += 1
+
+    tables[signature] = bytes(table)
+
+    os.makedirs(directory, exist_ok=True)
+    with open(path, 'wb') as file:
+        file.write(MAGIC + signature.encode().ljust(HEADER_SIZE - len(MAGIC), b'\0'))
+        file.write(tables[signature])
+
+    if verbose: print("Wrote", path, flush=True)
+
+    return tables[signature]
+
+
+# probes tablebase files through mmap. a probe is a piece scan plus a single byte read.
+class Tablebase:
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.tables = {}
+
+        # we never need to look at positions with more pieces than our biggest table
+        self.max_pieces = 2
+        if os.path.isdir(directory):
+            for name in os.listdir(directory):
+                if name.endswith('.tb'):
+                    self.max_pieces = max(self.max_pieces, len(name) - 3)
+
+
+    def close(self):
+        for table in self.tables.values():
+            if table is not None:
+                table[1].close()
+                table[0].close()
+        self.tables = {}
+
+
+    def _table(self, signature: str) -> mmap.mmap | None:
+        if signature not in self.tables:
+            path = os.path.join(self.directory, signature + '.tb')
+            if os.path.exists(path):
+                file = open(path, 'rb')
+                self.tables[signature] = (file, mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+            else:
+                self.tables[signature] = None
+
+        table = self.tables[signature]
+        return table[1] if table else None
+
+
+    # raw table byte for the position, or None if we don't have a table for it
+    def probe_raw(self, game: Game) -> int | None:
+        # castling can't happen in a tablebase position, so don't pretend it can
+        if game.white_castle_kingside or game.white_castle_queenside or game.black_castle_kingside or game.black_castle_queenside:
+            return None
+
+        pieces = []
+        for row in range(8):
+            for col in range(8):
+                piece = game.board[row][col]
+                if piece:
+                    if len(pieces) == self.max_pieces: return None
+                    pieces.append((PIECE_CHARACTERS[piece.piece_type], piece.piece_color == PieceColor.White, row*8 + col))
+
+        signature, pieces, white_to_move = canonicalize(pieces, game.side_to_move == PieceColor.White)
+
+        # the search happily takes kings, those positions aren't ours to answer
+        if signature.count('K') != 2 or signature[0] != 'K': return None
+        if is_insufficient_material(signature):
+            return ILLEGAL if _is_illegal(pieces, white_to_move) else DRAW
+
+        table = self._table(signature)
+        if table is None: return None
+
+        return table[HEADER_SIZE + position_index(pieces, white_to_move)]
+
+
+    # evaluation of the position from white's point of view (like evaluate_board_material), or None
+    # if there is no table for it or the position is illegal. faster mates score higher.
+    def probe(self, game: Game) -> int | None:
+        value = self.probe_raw(game)
+        if value is None or value == ILLEGAL: return None
+        if value == DRAW: return 0
+
+        score = TB_WIN_SCORE - value if value % 2 == 1 else -(TB_WIN_SCORE - (value - 2))
+        return score * game.side_to_move.value()
+
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "tablebases"
+    signatures = sys.argv[2:] or ["KQK", "KRK", "KPK"]
+
+    tables = {}
+    for signature in signatures:
+        generate(signature, directory, tables)
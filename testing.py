@@ -4,10 +4,15 @@
 import csv, random, time
 from engine import * 
 from game import *
+from analysis_cache import AnalysisCache
 
 
-# solves puzzles from a csv filepath, quite a lot is assumed here
-def solve_puzzles(filepath: str, num_puzzles: int = 20, depth=3):
+# solves puzzles from a csv filepath, quite a lot is assumed here. results are kept in the analysis
+# cache at cache_path, so puzzles already searched to this depth in an earlier run are skipped.
+def solve_puzzles(filepath: str, num_puzzles: int = 20, depth=3, cache_path: str | None = "analysis.cache"):
+    cache = AnalysisCache(cache_path) if cache_path else None
+    num_cached = 0
+
     with open(filepath, 'r') as file:
         csvreader = csv.reader(file)
         next(csvreader) # header
@@ -32,8 +37,15 @@ def solve_puzzles(filepath: str, num_puzzles: int = 20, depth=3):
             fen, best_move, rating = row[1], row[2], int(row[3])
             print(rating, "...", end=' ', flush=True)
 
-            # get best move
-            generated_move, _ = brute_force_best_move(Game(fen), depth)
+            # get best move, unless we already know it
+            game = Game(fen)
+            cached = cache.lookup(game, depth, engine="brute_force") if cache else None
+            if cached:
+                generated_move, _ = cached
+                num_cached += 1
+            else:
+                generated_move, evaluation = brute_force_best_move(game, depth)
+                if cache and generated_move: cache.store(game, generated_move, evaluation, depth, engine="brute_force")
 
             # determine result
             if best_move == str(generated_move):
@@ -53,8 +65,11 @@ def solve_puzzles(filepath: str, num_puzzles: int = 20, depth=3):
         # results
         print("\n\n--------------------RESULTS--------------------")
         print(num_puzzles, "puzzles attempted,", num_correct, "correct,", num_puzzles-num_correct, "incorrect in", str(round(time.time()-start, 1)), "seconds")
+        print(num_cached, "positions came from the analysis cache")
         print("Highest problem solved:", highest_problem_solved)
         print("Estimated engine ELO:", round(elo), "\n\n")
 
+    if cache: cache.close()
+
 
 solve_puzzles("lichess_db_puzzle_with_stockfish_eval.csv", num_puzzles=20, depth=4)
\ No newline at end of file
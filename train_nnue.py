@@ -0,0 +1,145 @@
+# trains the nnue network (see nnue.py) on the same stockfish evaluations tune.py uses, with the same
+# cached positions and the same sigmoid loss. training is plain numpy: the sparse input layer is a
+# one-hot batch times w1, the rest is a tiny dense network. weights are kept inside the range the
+# quantised network can hold, so rounding them at the end loses very little.
+#
+#   python train_nnue.py --csv lichess_db_puzzle_with_stockfish_eval.csv --output nnue.npz
+
+
+import argparse, math, os, time
+import numpy as np
+from nnue import Network, NUM_FEATURES, HIDDEN_SIZE, HEAD_SIZE, QA, QB
+from position_batch import piece_squares
+from tune import load_dataset, expected_score
+
+
+# the active features of every position, padded with NUM_FEATURES (a row of w1 that is always 0)
+def active_features(positions: np.ndarray) -> np.ndarray:
+    squares = piece_squares(positions).astype(np.int64)
+    features = np.where(squares > 0, (squares - 1) * 64 + np.arange(64), NUM_FEATURES)
+    features.sort(axis=1)
+    return features[:, :32]
+
+
+def one_hot(features: np.ndarray) -> np.ndarray:
+    inputs = np.zeros((len(features), NUM_FEATURES + 1), dtype=np.float32)
+    np.put_along_axis(inputs, features, 1.0, axis=1)
+    return inputs[:, :NUM_FEATURES]
+
+
+class Trainer:
+    def __init__(self, seed: int = 0):
+        rng = np.random.default_rng(seed)
+        self.parameters = {
+            "w1": rng.normal(0, 0.05, (NUM_FEATURES, HIDDEN_SIZE)).astype(np.float32),
+            "b1": np.full(HIDDEN_SIZE, 0.25, dtype=np.float32),
+            "w2": rng.normal(0, 1 / math.sqrt(HIDDEN_SIZE), (HIDDEN_SIZE, HEAD_SIZE)).astype(np.float32),
+            "b2": np.zeros(HEAD_SIZE, dtype=np.float32),
+            "w3": rng.normal(0, 1 / math.sqrt(HEAD_SIZE), HEAD_SIZE).astype(np.float32),
+            "b3": np.zeros(1, dtype=np.float32)
+        }
+        self.first_moments = {name: np.zeros_like(value) for name, value in self.parameters.items()}
+        self.second_moments = {name: np.zeros_like(value) for name, value in self.parameters.items()}
+        self.steps = 0
+
+
+    # the float version of Network.forward, keeping what backward needs
+    def forward(self, inputs: np.ndarray) -> tuple[np.ndarray, tuple]:
+        p = self.parameters
+        hidden_in = inputs @ p["w1"] + p["b1"]
+        hidden = np.clip(hidden_in, 0, 1)
+        head_in = hidden @ p["w2"] + p["b2"]
+        head = np.clip(head_in, 0, 1)
+        return head @ p["w3"] + p["b3"], (inputs, hidden_in, hidden, head_in, head)
+
+
+    # one adam step on a batch, returns the batch loss
+    def step(self, inputs: np.ndarray, targets: np.ndarray, learning_rate: float, scale: float) -> float:
+        p = self.parameters
+        output, (inputs, hidden_in, hidden, head_in, head) = self.forward(inputs)
+
+        predicted = expected_score(output, scale)
+        d_output = (predicted - targets) * predicted * (1 - predicted) * (2 * scale / len(inputs))
+        d_head = np.outer(d_output, p["w3"]) * ((head_in > 0) & (head_in < 1))
+        d_hidden = (d_head @ p["w2"].T) * ((hidden_in > 0) & (hidden_in < 1))
+
+        gradients = {
+            "w3": head.T @ d_output, "b3": np.array([d_output.sum()]),
+            "w2": hidden.T @ d_head, "b2": d_head.sum(axis=0),
+            "w1": inputs.T @ d_hidden, "b1": d_hidden.sum(axis=0)
+        }
+
+        self.steps += 1
+        for name, gradient in gradients.items():
+            self.first_moments[name] = 0.9 * self.first_moments[name] + 0.1 * gradient
+            self.second_moments[name] = 0.999 * self.second_moments[name] + 0.001 * gradient ** 2
+            corrected_first = self.first_moments[name] / (1 - 0.9 ** self.steps)
+            corrected_second = self.second_moments[name] / (1 - 0.999 ** self.steps)
+            p[name] -= learning_rate * corrected_first / (np.sqrt(corrected_second) + 1e-8)
+
+        # stay where the quantised network can follow: int8 dense weights, and accumulators that
+        # can't overflow int16 even with 32 pieces on the board
+        np.clip(p["w2"], -127 / QB, 127 / QB, out=p["w2"])
+        np.clip(p["w3"], -127 / QB, 127 / QB, out=p["w3"])
+        np.clip(p["w1"], -32767 / QA / 33, 32767 / QA / 33, out=p["w1"])
+
+        return float(np.mean((predicted - targets) ** 2))
+
+
+    def loss(self, features: np.ndarray, targets: np.ndarray, scale: float, batch_size: int = 4096) -> float:
+        total = 0.0
+        for i in range(0, len(features), batch_size):
+            output, _ = self.forward(one_hot(features[i:i+batch_size]))
+            total += float(np.sum((expected_score(output, scale) - targets[i:i+batch_size]) ** 2))
+        return total / max(len(features), 1)
+
+
+    def network(self) -> Network:
+        p = self.parameters
+        return Network.quantize(p["w1"], p["b1"], p["w2"], p["b2"], p["w3"], float(p["b3"][0]))
+
+
+def train(positions: np.ndarray, evaluations: np.ndarray, epochs: int = 10, batch_size: int = 1024, learning_rate: float = 0.001,
+          scale: float = math.log(10) / 4, validation: float = 0.1, seed: int = 0, verbose: bool = True) -> Network:
+    rng = np.random.default_rng(seed)
+    features = active_features(positions)
+    targets = expected_score(evaluations, scale)
+
+    order = rng.permutation(len(features))
+    split = int(len(features) * (1 - validation))
+    train_order, held_out = order[:split], order[split:]
+
+    trainer = Trainer(seed)
+    for epoch in range(1, epochs + 1):
+        start = time.perf_counter()
+        rng.shuffle(train_order)
+
+        losses = []
+        for i in range(0, len(train_order), batch_size):
+            batch = train_order[i:i+batch_size]
+            losses.append(trainer.step(one_hot(features[batch]), targets[batch], learning_rate, scale))
+
+        if verbose:
+            held_out_loss = trainer.loss(features[held_out], targets[held_out], scale) if len(held_out) else float('nan')
+            print(f"epoch {epoch}: train loss {np.mean(losses):.6f}, validation loss {held_out_loss:.6f} ({round(time.perf_counter() - start, 2)}s)", flush=True)
+
+    return trainer.network()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="train the nnue evaluation on stockfish evaluations")
+    parser.add_argument("--csv", default="lichess_db_puzzle_with_stockfish_eval.csv")
+    parser.add_argument("--cache", help="where to keep the encoded positions (default: next to the csv)")
+    parser.add_argument("--output", default="nnue.npz")
+    parser.add_argument("--epochs", type=int, default=10)
+    parser.add_argument("--batch-size", type=int, default=1024)
+    parser.add_argument("--learning-rate", type=float, default=0.001)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    positions, evaluations = load_dataset(args.csv, args.cache, args.workers)
+    print(f"{len(positions)} positions")
+
+    network = train(positions, evaluations, args.epochs, args.batch_size, args.learning_rate)
+    network.to_file(args.output)
+    print(f"network written to {args.output}")
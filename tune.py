@@ -0,0 +1,165 @@
+# texel-style tuning of the material and piece-square weights against the stockfish evaluations in
+# lichess_db_puzzle_with_stockfish_eval.csv. every position is turned into a row of features once
+# (and cached next to the csv), after that the evaluation of the whole dataset is a single matrix
+# product, so a full gradient descent pass is a couple of numpy calls.
+#
+#   python tune.py --csv lichess_db_puzzle_with_stockfish_eval.csv --output eval_weights.json
+
+
+import argparse, csv, math, os, time
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from game import Game
+from piece import ZOBRIST_INDICES
+from position_batch import POSITION_SIZE, piece_squares
+from evaluation import EvaluationWeights, PIECE_NAMES
+
+
+PIECE_ORDER = list(PIECE_NAMES.values())                 # pawn, knight, bishop, rook, queen, king
+MATERIAL_PIECES = PIECE_ORDER[:-1]                       # the king's value isn't tuned
+NUM_FEATURES = len(MATERIAL_PIECES) + len(PIECE_ORDER) * 64
+
+# (piece index in PIECE_ORDER, +1 for white / -1 for black) for every nibble in the packed format
+NIBBLE_PIECES = {index + 1: (PIECE_ORDER.index(PIECE_NAMES[piece_type]), piece_color.value()) for (piece_type, piece_color), index in ZOBRIST_INDICES.items()}
+
+CACHE_VERSION = 1
+
+
+# runs in a worker process, packs a chunk of fens (see Game.to_bytes)
+def pack_fens(fens: list[str]) -> bytes:
+    return b''.join(Game(fen).to_bytes() for fen in fens)
+
+
+# the fens and evaluations (in pawns, white's point of view) of every row that has an evaluation
+def read_csv(path: str) -> tuple[list[str], np.ndarray]:
+    fens, evaluations = [], []
+    with open(path, newline='') as file:
+        for row in csv.DictReader(file):
+            try:
+                evaluation = float(row["Evaluation"])
+            except (ValueError, TypeError):
+                continue
+            if math.isnan(evaluation): continue
+            fens.append(row["FEN"])
+            evaluations.append(evaluation / 100)
+
+    return fens, np.array(evaluations, dtype=np.float32)
+
+
+# packed positions and evaluations for the whole csv. the slow part (going through Game for every
+# fen) runs once on all cores, the result is cached and reused while the csv doesn't change.
+def load_dataset(csv_path: str, cache_path: str | None = None, num_workers: int = os.cpu_count() or 1) -> tuple[np.ndarray, np.ndarray]:
+    cache_path = cache_path or os.path.splitext(csv_path)[0] + ".positions.npz"
+    source = np.array([CACHE_VERSION, os.path.getsize(csv_path), int(os.path.getmtime(csv_path))], dtype=np.int64)
+
+    if os.path.exists(cache_path):
+        cached = np.load(cache_path)
+        if np.array_equal(cached["source"], source):
+            return cached["positions"], cached["evaluations"]
+
+    fens, evaluations = read_csv(csv_path)
+    chunks = [fens[i:i+2048] for i in range(0, len(fens), 2048)]
+    with ProcessPoolExecutor(num_workers) as pool:
+        data = b''.join(pool.map(pack_fens, chunks))
+    positions = np.frombuffer(data, dtype=np.uint8).reshape(-1, POSITION_SIZE)
+
+    np.savez(cache_path, positions=positions, evaluations=evaluations, source=source)
+    return positions, evaluations
+
+
+# one row per position: the material difference of each piece type, then +1 / -1 for every white /
+# black piece on its piece-square entry (black's squares flipped), so evaluation = features @ weights
+def build_features(positions: np.ndarray) -> np.ndarray:
+    squares = piece_squares(positions)
+    flipped = np.arange(64) ^ 56
+    features = np.zeros((len(positions), NUM_FEATURES), dtype=np.float32)
+
+    for nibble, (piece, sign) in NIBBLE_PIECES.items():
+        on_square = (squares == nibble).astype(np.float32) * sign
+        if piece < len(MATERIAL_PIECES):
+            features[:, piece] += on_square.sum(axis=1)
+
+        table = features[:, len(MATERIAL_PIECES) + piece*64 : len(MATERIAL_PIECES) + (piece + 1)*64]
+        table += on_square if sign > 0 else on_square[:, flipped]
+
+    return features
+
+
+def weights_to_vector(weights: EvaluationWeights) -> np.ndarray:
+    return np.array([weights.material[name] for name in MATERIAL_PIECES] + [value for name in PIECE_ORDER for value in weights.piece_square[name]], dtype=np.float32)
+
+
+def vector_to_weights(vector: np.ndarray) -> EvaluationWeights:
+    vector = [round(float(value), 4) for value in vector]
+    material = dict(zip(MATERIAL_PIECES, vector[:len(MATERIAL_PIECES)]))
+    offset = len(MATERIAL_PIECES)
+    return EvaluationWeights(material, {name: vector[offset + i*64 : offset + (i + 1)*64] for i, name in enumerate(PIECE_ORDER)})
+
+
+# evaluations (in pawns) are squashed to an expected score, 400 centipawns being ten to one odds
+def expected_score(evaluations: np.ndarray, scale: float) -> np.ndarray:
+    return 1 / (1 + np.exp(-evaluations * scale))
+
+
+def loss(features: np.ndarray, targets: np.ndarray, vector: np.ndarray, scale: float) -> float:
+    return float(np.mean((expected_score(features @ vector, scale) - targets) ** 2))
+
+
+# full batch adam on the mean squared error between expected scores. the piece-square tables get a
+# small l2 penalty so they only move away from 0 where the data wants them to.
+def tune(features: np.ndarray, evaluations: np.ndarray, initial: EvaluationWeights | None = None, iterations: int = 500, learning_rate: float = 0.01,
+         regularization: float = 1e-5, scale: float = math.log(10) / 4, validation: float = 0.1, seed: int = 0, verbose: bool = True) -> EvaluationWeights:
+    rng = np.random.default_rng(seed)
+    order = rng.permutation(len(features))
+    split = int(len(features) * (1 - validation))
+    train, held_out = order[:split], order[split:]
+
+    features_train, targets_train = features[train], expected_score(evaluations[train], scale)
+    features_held_out, targets_held_out = features[held_out], expected_score(evaluations[held_out], scale)
+
+    vector = weights_to_vector(initial or EvaluationWeights.default())
+    penalized = np.zeros_like(vector)
+    penalized[len(MATERIAL_PIECES):] = regularization
+
+    first_moment, second_moment = np.zeros_like(vector), np.zeros_like(vector)
+    for iteration in range(1, iterations + 1):
+        predicted = expected_score(features_train @ vector, scale)
+        error = (predicted - targets_train) * predicted * (1 - predicted) * (2 * scale / len(train))
+        gradient = features_train.T @ error + 2 * penalized * vector
+
+        first_moment = 0.9 * first_moment + 0.1 * gradient
+        second_moment = 0.999 * second_moment + 0.001 * gradient ** 2
+        vector -= learning_rate * (first_moment / (1 - 0.9 ** iteration)) / (np.sqrt(second_moment / (1 - 0.999 ** iteration)) + 1e-8)
+
+        if verbose and (iteration % 50 == 0 or iteration == iterations):
+            held_out_loss = loss(features_held_out, targets_held_out, vector, scale) if len(held_out) else float('nan')
+            print(f"iteration {iteration}: train loss {loss(features_train, targets_train, vector, scale):.6f}, validation loss {held_out_loss:.6f}", flush=True)
+
+    return vector_to_weights(vector)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="tune the evaluation weights on stockfish evaluations")
+    parser.add_argument("--csv", default="lichess_db_puzzle_with_stockfish_eval.csv")
+    parser.add_argument("--cache", help="where to keep the encoded positions (default: next to the csv)")
+    parser.add_argument("--output", default="eval_weights.json")
+    parser.add_argument("--start", help="weights file to start from instead of plain material")
+    parser.add_argument("--iterations", type=int, default=500)
+    parser.add_argument("--learning-rate", type=float, default=0.01)
+    parser.add_argument("--regularization", type=float, default=1e-5)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    positions, evaluations = load_dataset(args.csv, args.cache, args.workers)
+    features = build_features(positions)
+    print(f"{len(positions)} positions encoded in {round(time.perf_counter() - start, 2)}s")
+
+    start = time.perf_counter()
+    initial = EvaluationWeights.from_file(args.start) if args.start else None
+    weights = tune(features, evaluations, initial, args.iterations, args.learning_rate, args.regularization)
+    print(f"tuned in {round(time.perf_counter() - start, 2)}s")
+
+    weights.to_file(args.output)
+    print("material:", {name: round(value, 2) for name, value in weights.material.items()})
+    print(f"weights written to {args.output}")